@@ -12,5 +12,6 @@ rsync -r --del ./build/ ./django/build
 cd django
 python manage.py migrate
 python manage.py loaddata menu-fixture
-python manage.py loaddata order-fixture
+# The order fixture is demo data and is not loaded on deploy. Reloading it over real orders fails on the unique
+# (order, item) constraint and reuses archived order numbers. Load it locally with 'manage.py loaddata order-fixture'
 python manage.py collectstatic --no-input
\ No newline at end of file
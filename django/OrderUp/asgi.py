@@ -2,6 +2,8 @@
 ASGI config for OrderUp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to the live order feed are streamed by ``order.feed``, order exports by ``order.export``
+and everything else is handled by Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -13,4 +15,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'OrderUp.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up since the feed reads settings
+from order.export import ORDER_EXPORT_PATH, order_export  # noqa: E402
+from order.feed import ORDER_FEED_PATH, order_feed  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == ORDER_FEED_PATH:
+        await order_feed(scope, receive, send)
+    elif scope["type"] == "http" and scope["path"] == ORDER_EXPORT_PATH:
+        await order_export(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
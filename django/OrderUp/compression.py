@@ -0,0 +1,66 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # Optional. Responses are only gzipped without it
+    brotli = None
+
+# Only API payloads are compressed. HTML is left alone since pages with CSRF tokens are open to BREACH when compressed
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "application/x-ndjson", "text/csv", "text/plain")
+_accepts_brotli = re.compile(r"\bbr\b")
+_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def choose_encoding(accept_encoding):
+    """Picks "br" or "gzip" from an Accept-Encoding header. Returns None if the client accepts neither"""
+    if brotli is not None and _accepts_brotli.search(accept_encoding):
+        return "br"
+    if _accepts_gzip.search(accept_encoding):
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses API responses of at least COMPRESSION_MIN_BYTES with brotli (if installed) or gzip, depending on
+    Accept-Encoding. Static files are served precompressed by WhiteNoise instead
+    Streaming responses (e.g. order/export) are sent as they are
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header("Content-Encoding") or response.status_code in (206, 304):
+            return response
+        if response.get("Content-Type", "").split(";")[0].strip() not in COMPRESSIBLE_CONTENT_TYPES:
+            return response
+
+        # The response varies by encoding even when this client gets it uncompressed
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        if encoding == "br":
+            compressed = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            compressed = compress_string(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        # The compressed bytes differ from the ones the ETag was computed for
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
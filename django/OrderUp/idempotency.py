@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .instrumentation import route_of
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Keys become part of cache keys, so only id-like values are accepted (e.g. UUIDs)
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,100}$")
+# Response headers stored and replayed along with the status and body
+REPLAYED_RESPONSE_HEADERS = ("Content-Type", "Retry-After")
+
+
+def request_fingerprint(request):
+    """SHA-256 of the method, path and body. A key may only be reused for the same request"""
+    fingerprint = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        fingerprint.update(part)
+        fingerprint.update(b"\0")
+    return fingerprint.hexdigest()
+
+
+def replay_response(stored):
+    response = HttpResponse(stored["content"], status=stored["status"])
+    for header, value in stored["headers"].items():
+        response[header] = value
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def idempotent(view):
+    """
+    Lets clients retry a view safely by sending an Idempotency-Key header (e.g. a UUID per user action)
+    The first response for a key is kept in the cache for IDEMPOTENCY_TTL_SECONDS and replayed for repeats of the
+    request without running the view again. Keys are scoped to the URL route. Requests without the header run as usual
+    Responds with 422 if the key was used for a different request and with 409 while the first request is running
+    Server errors (5xx) and exceptions are not kept, so those requests can be retried with the same key
+    Needs a cache shared by every worker (REDIS_URL) for repeats to be caught across workers
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not IDEMPOTENCY_KEY_PATTERN.match(key):
+            return HttpResponse("Invalid Idempotency Key", status=400)
+
+        cache_key = f"idempotency:{route_of(request)}:{key}"
+        fingerprint = request_fingerprint(request)
+        # Claims the key. The short timeout frees it if this worker dies before storing the response
+        if not cache.add(cache_key, {"fingerprint": fingerprint, "done": False},
+                         timeout=settings.IDEMPOTENCY_PENDING_SECONDS):
+            stored = cache.get(cache_key)
+            if stored is not None and stored["fingerprint"] != fingerprint:
+                return HttpResponse(f"Idempotency Key [{key}] Was Used For A Different Request", status=422)
+            if stored is None or not stored["done"]:
+                response = HttpResponse(f"Request With Idempotency Key [{key}] Is Still In Progress", status=409)
+                response["Retry-After"] = "1"
+                return response
+            logger.debug("Idempotent Response Replayed [%s]", key)
+            return replay_response(stored)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+        if response.status_code >= 500 or response.streaming:
+            cache.delete(cache_key)
+            return response
+
+        cache.set(cache_key, {
+            "fingerprint": fingerprint,
+            "done": True,
+            "status": response.status_code,
+            "content": response.content,
+            "headers": {header: response[header] for header in REPLAYED_RESPONSE_HEADERS if response.has_header(header)},
+        }, timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+        return response
+
+    return wrapper
@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponseForbidden, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds. Observations above the last bound land in the "+Inf" bucket
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current_metrics = ContextVar("request_metrics", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised by PerformanceMiddleware when PERFORMANCE_BUDGET_MODE is 'raise' and a route runs too many queries"""
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.timings = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook counting and timing every query of the request"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.query_count += 1
+
+
+@contextmanager
+def timed(name):
+    """Adds the duration of the block to the current request's timings (e.g. timed("serialize") around serializers)"""
+    metrics = _current_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.timings[name] = metrics.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def as_dict(self):
+        labels = [str(bound) for bound in self.bounds] + ["+Inf"]
+        return {"buckets": dict(zip(labels, self.counts)), "sum": round(self.total, 3), "max": round(self.maximum, 3)}
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.wall_ms = Histogram(DURATION_BUCKETS_MS)
+        self.db_ms = Histogram(DURATION_BUCKETS_MS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.timings_ms = {}
+
+    def observe(self, wall_ms, metrics):
+        self.requests += 1
+        self.wall_ms.observe(wall_ms)
+        self.db_ms.observe(metrics.db_seconds * 1000)
+        self.queries.observe(metrics.query_count)
+        for name, seconds in metrics.timings.items():
+            self.timings_ms.setdefault(name, Histogram(DURATION_BUCKETS_MS)).observe(seconds * 1000)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "wall_ms": self.wall_ms.as_dict(),
+            "db_ms": self.db_ms.as_dict(),
+            "queries": self.queries.as_dict(),
+            **{f"{name}_ms": histogram.as_dict() for name, histogram in self.timings_ms.items()}
+        }
+
+
+class MetricsRegistry:
+    """Per-route histograms of the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, wall_ms, metrics):
+        with self._lock:
+            self._routes.setdefault(route, RouteMetrics()).observe(wall_ms, metrics)
+
+    def snapshot(self):
+        with self._lock:
+            return {route: route_metrics.as_dict() for route, route_metrics in sorted(self._routes.items())}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+registry = MetricsRegistry()
+
+
+def route_of(request):
+    """URL pattern of the resolved view (e.g. 'order/fulfill/change/<int:order_number>') to group requests by"""
+    resolver_match = getattr(request, "resolver_match", None)
+    return resolver_match.route if resolver_match is not None else "<unresolved>"
+
+
+class PerformanceMiddleware:
+    """
+    Records wall time, query count, DB time and named timings (see timed()) for each request
+    Adds them to the response as a Server-Timing header and to the per-route histograms served by metrics_view
+    Routes in PERFORMANCE_QUERY_BUDGETS running more queries than their budget log a warning,
+    or raise QueryBudgetExceeded when PERFORMANCE_BUDGET_MODE is 'raise' (e.g. in tests)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metrics.record_query):
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        route = route_of(request)
+        registry.observe(route, wall_ms, metrics)
+        response["Server-Timing"] = ", ".join([
+            f"app;dur={wall_ms:.2f}",
+            f'db;dur={metrics.db_seconds * 1000:.2f};desc="{metrics.query_count} queries"',
+            *(f"{name};dur={seconds * 1000:.2f}" for name, seconds in metrics.timings.items())
+        ])
+
+        budget = settings.PERFORMANCE_QUERY_BUDGETS.get(route)
+        if budget is not None and metrics.query_count > budget:
+            message = f"Query budget exceeded for [{route}]: {metrics.query_count} queries (budget {budget})"
+            if settings.PERFORMANCE_BUDGET_MODE == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def metrics_view(request):
+    """Per-route histograms of this process. Only served to local requests or in DEBUG"""
+    if not settings.DEBUG and request.META.get("REMOTE_ADDR") not in ("127.0.0.1", "::1"):
+        return HttpResponseForbidden("Metrics Are Only Available Locally")
+    return JsonResponse({"routes": registry.snapshot()})
@@ -0,0 +1,144 @@
+import atexit
+import json
+import logging
+import queue
+import re
+import sys
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from random import random
+
+# Incoming X-Request-ID values are reused only if they look like ids, since they end up in every log line
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# Records waiting for the writer thread. Further records are dropped rather than blocking a request
+LOG_QUEUE_SIZE = 10000
+
+_request_id = ContextVar("request_id", default=None)
+_route = ContextVar("route", default=None)
+
+# Attributes every LogRecord has. Anything else was passed with extra= and is added to the JSON output
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "route"}
+
+
+class RequestIdMiddleware:
+    """
+    Tags every log record of a request with a request id (the client's X-Request-ID or a new one) and its URL route
+    The id is echoed back in the X-Request-ID response header to match client reports with log lines
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        request_id_token = _request_id.set(request_id)
+        route_token = _route.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(request_id_token)
+            _route.reset(route_token)
+        response["X-Request-ID"] = request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The route is only known once the URL is resolved, which happens after __call__ starts
+        _route.set(request.resolver_match.route)
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds request_id and route to records. Runs on the logging thread, where the request context is visible"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.route = _route.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the INFO and DEBUG records per URL route. Warnings and errors are always kept
+    Sampling is decided per request id, so a sampled request keeps all of its records
+    :param rates: Dictionary of URL route (as in PERFORMANCE_QUERY_BUDGETS) to the fraction kept. 'default' applies
+                  to other routes and to records logged outside of requests
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        route = getattr(record, "route", None)
+        rate = self.rates.get(route, self.rates.get("default", 1.0))
+        if rate >= 1:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return random() < rate
+        return zlib.crc32(request_id.encode()) % 10000 < rate * 10000
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Values passed with extra= become fields of the object"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+            entry["route"] = record.route
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Queues records on the logging thread and writes them to a stream from one background thread,
+    so requests never wait on log I/O. The formatter set on this handler is used by the writer thread
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.Queue(LOG_QUEUE_SIZE))
+        self.writer = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.writer)
+        self.listener.start()
+        # Flushes the records still queued when the process exits
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        self.writer.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Merges the message arguments now, since they may change or be unpicklable by the time the writer runs.
+        Formatting the rest of the record is left to the writer thread
+        """
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
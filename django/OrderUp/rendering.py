@@ -0,0 +1,37 @@
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from .instrumentation import timed
+
+
+def stdlib_dumps(data):
+    """Encodes exactly like JsonResponse. The default JSON_ENCODER"""
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def orjson_dumps(data):
+    """
+    Encodes with orjson (optional dependency, several times faster than the stdlib encoder on large lists)
+    The output is compact (no spaces after separators) but otherwise decodes to the same values as stdlib_dumps
+    """
+    import orjson
+    # Datetimes go through DjangoJSONEncoder to keep its format (e.g. milliseconds and 'Z')
+    return orjson.dumps(data, default=DjangoJSONEncoder().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+@lru_cache(maxsize=None)
+def get_json_encoder():
+    """Returns the function configured by JSON_ENCODER, which turns plain data into JSON bytes"""
+    return import_string(getattr(settings, "JSON_ENCODER", "OrderUp.rendering.stdlib_dumps"))
+
+
+def json_response(data, status=200):
+    """Same as JsonResponse(data), encoded with the configured JSON_ENCODER"""
+    with timed("encode"):
+        body = get_json_encoder()(data)
+    return HttpResponse(body, content_type="application/json", status=status)
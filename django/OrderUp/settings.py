@@ -1,8 +1,11 @@
 import os.path
+import sys
 from os import getenv
 from pathlib import Path
 from dotenv import load_dotenv
 
+from .database import parse_database_url, sqlite_database
+
 # Load environment variables (Env file should be in the repository root with a relative path of ../.env)
 load_dotenv()
 # Set base directory for absolute path creation
@@ -36,7 +39,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'OrderUp.logs.RequestIdMiddleware',
+    'OrderUp.instrumentation.PerformanceMiddleware',
+    'OrderUp.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,12 +70,40 @@ TEMPLATES = [
 ]
 
 # Database configurations
+# DATABASE_URL (e.g. the PostgreSQL connection string from 'render.yaml') takes priority
+# Falls back to SQLite at 'django/db.sqlite3' with WAL journaling and a busy timeout
+DATABASE_URL = getenv("DATABASE_URL")
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': parse_database_url(DATABASE_URL) if DATABASE_URL else sqlite_database(BASE_DIR / 'db.sqlite3')
 }
+# Connections are closed after every request by default. Under ASGI (the default start command) Django 4.1 runs each
+# request on a new thread with a connection of its own, so persistent connections would never be reused or closed
+# (Django ticket #33497). Only set DB_CONN_MAX_AGE (seconds) when serving through 'OrderUp.wsgi:application'
+DATABASES['default']['CONN_MAX_AGE'] = int(getenv("DB_CONN_MAX_AGE", "0"))
+# Checks a reused connection still works before handing it to a request (When DB_CONN_MAX_AGE is set)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+# Set DB_POOLER to 'pgbouncer' when connecting through PgBouncer in transaction pooling mode
+# Server-side cursors do not survive transaction pooling since consecutive transactions may use different connections
+DB_POOLER = getenv("DB_POOLER", "")
+if DB_POOLER == "pgbouncer":
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+# Cache configurations (File based by default so every worker on a host shares it and sees invalidations)
+# Set REDIS_URL to share the cache across hosts instead (Requires the 'redis' package)
+REDIS_URL = getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / '.cache',
+        }
+    }
 # Default primary key auto field type for implied ids
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -77,6 +112,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STATIC_URL = '/react/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = []
+# Served by WhiteNoise (see MIDDLEWARE), with range and conditional requests
+# collectstatic writes gzip and brotli copies of every file next to it, and WhiteNoise picks one per Accept-Encoding
+STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
+# The React build names its bundles with content hashes (e.g. 'static/js/main.1a2b3c4d.js'),
+# so those are cached for a year as immutable. Other files (e.g. 'index.html') are revalidated
+WHITENOISE_IMMUTABLE_FILE_TEST = r"/static/(js|css|media)/[^/]+\.[0-9a-f]{8,32}\.(chunk\.)?[A-Za-z0-9]+(\.map)?$"
 
 # React build overrides applied if 'django/build' exists
 REACT_BUILD_FOUND = os.path.isdir(BASE_DIR / "build")
@@ -86,10 +127,25 @@ if not REACT_BUILD_FOUND:
 else:
     STATICFILES_DIRS = [os.path.join(BASE_DIR / "build")]
 
+# API responses at least this large are compressed with brotli or gzip ('OrderUp/compression.py')
+COMPRESSION_MIN_BYTES = int(getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_BROTLI_QUALITY = 4  # Of 11. Low qualities compress about as fast as gzip while still beating it on size
+
 # Media files (For this project, they are all the optional menu item images)
 MEDIA_URL = '/mediafiles/'
 MEDIA_ROOT = BASE_DIR / 'mediafiles'
 
+# Largest image accepted by the streaming upload endpoint ('images/streaming.py')
+IMAGE_UPLOAD_MAX_BYTES = int(getenv("IMAGE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Resized image variants generated in the background for each upload ('images/variants.py')
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_FORMATS = ["webp", "jpeg"]
+IMAGE_VARIANT_WORKERS = int(getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+# Seconds the local copy of the S3 listing is served before a background refresh is started ('images/inventory.py')
+IMAGE_INVENTORY_TTL_SECONDS = int(getenv("IMAGE_INVENTORY_TTL_SECONDS", "300"))
+
 # Media files S3 bucket support
 S3_ENABLED = getenv("S3_ENABLED", "False") == "True"
 if S3_ENABLED:
@@ -109,8 +165,102 @@ if S3_ENABLED:
     AWS_S3_REGION_ENDPOINT_URL = getenv("S3_REGION_DOMAIN")
     AWS_STORAGE_BUCKET_NAME = getenv("S3_STORAGE_BUCKET_NAME")
     AWS_DEFAULT_ACL = getenv("S3_DEFAULT_ACL")
-    # TODO: Check if Cache Control is required
-    AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=43200'}  # 12 Hours
+
+    # Image URLs handed out by the API: 'presigned' (Expiring signed URLs, works with private buckets) or
+    # 'public' (Plain object URLs for a public-read S3_DEFAULT_ACL, optionally through a CDN at S3_CUSTOM_DOMAIN)
+    IMAGE_URL_MODE = getenv("IMAGE_URL_MODE", "presigned")
+    AWS_QUERYSTRING_AUTH = IMAGE_URL_MODE == "presigned"
+    AWS_QUERYSTRING_EXPIRE = int(getenv("IMAGE_URL_EXPIRES_SECONDS", "3600"))
+    AWS_S3_CUSTOM_DOMAIN = getenv("S3_CUSTOM_DOMAIN")
+    # Stored files are never overwritten (A suffix is added to taken names), so every object can be cached for good
+    AWS_S3_FILE_OVERWRITE = False
+    AWS_S3_OBJECT_PARAMETERS = {
+        'CacheControl': f'{"public" if IMAGE_URL_MODE == "public" else "private"}, max-age=31536000, immutable'
+    }
+
+# Structured JSON logs written to stdout by a background thread ('OrderUp/logs.py')
+LOG_LEVEL = getenv("LOG_LEVEL", "INFO")
+# Fraction of requests whose INFO and DEBUG records are kept for each URL route ('default' for the others)
+# Warnings and errors are always kept
+LOG_SAMPLING = {
+    'default': float(getenv("LOG_SAMPLE_RATE", "1.0")),
+    'cart/view/<str:cart_id>': 0.1,
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'OrderUp.logs.RequestContextFilter'},
+        'sampling': {'()': 'OrderUp.logs.SamplingFilter', 'rates': LOG_SAMPLING},
+    },
+    'formatters': {
+        'json': {'()': 'OrderUp.logs.JsonFormatter'},
+    },
+    'handlers': {
+        'background': {
+            '()': 'OrderUp.logs.BackgroundHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'json',
+            # Order matters: sampling reads the request context added by the first filter
+            'filters': ['request_context', 'sampling'],
+        },
+    },
+    'root': {'handlers': ['background'], 'level': LOG_LEVEL},
+    'loggers': {
+        # Replaces Django's default console handler, which would print request errors a second time
+        'django': {'handlers': ['background'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Per-request performance instrumentation ('OrderUp/instrumentation.py')
+# Maximum queries per request for each URL route. Exceeding one logs a warning ('warn') or raises ('raise', for tests)
+# Raises by default under 'manage.py test', so a regression past a budget fails the test suite
+PERFORMANCE_BUDGET_MODE = getenv("PERFORMANCE_BUDGET_MODE", "raise" if sys.argv[1:2] == ["test"] else "warn")
+PERFORMANCE_QUERY_BUDGETS = {
+    'order/list': 2,
+    'order/sync': 8,
+    'order/fulfill/change/<int:order_number>': 3,
+    'order/delete/<int:order_number>': 11,
+    'order/batch': 15,
+    'order/history': 1,
+    'order/stats': 2,
+    'cart/view/<str:cart_id>': 3,
+    'cart/sync': 7,
+    'cart/patch': 12,
+    'cart/place/<str:cart_id>': 10,
+    'menu/list': 1,
+}
+
+# Encoder for the list endpoints and the menu payload ('OrderUp/rendering.py')
+# 'OrderUp.rendering.orjson_dumps' is faster on large lists but needs 'pip install orjson' and emits compact JSON
+JSON_ENCODER = getenv("JSON_ENCODER", "OrderUp.rendering.stdlib_dumps")
+
+# Where carts are kept between changes ('cart/stores.py')
+# 'cart.stores.CacheCartStore' keeps them in CACHES and writes them to the database in the background,
+# which needs a cache shared by every worker (REDIS_URL) in production
+CART_STORE = getenv("CART_STORE", "cart.stores.DatabaseCartStore")
+CART_FLUSH_SECONDS = float(getenv("CART_FLUSH_SECONDS", "5"))  # Delay before changed carts are written behind
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+CART_LOCK_WAIT_SECONDS = 5
+# Cart.last_touched is only rewritten on a view once it is older than this, so most views stay read-only
+CART_TOUCH_INTERVAL_SECONDS = 5 * 60
+# Carts untouched for longer than this are deleted by 'manage.py gc_carts' ('cart/gc.py')
+CART_EXPIRE_AFTER_DAYS = float(getenv("CART_EXPIRE_AFTER_DAYS", "30"))
+
+# Responses kept for requests sent with an Idempotency-Key header ('OrderUp/idempotency.py')
+IDEMPOTENCY_TTL_SECONDS = int(getenv("IDEMPOTENCY_TTL_SECONDS", str(60 * 60 * 24)))
+IDEMPOTENCY_PENDING_SECONDS = 60  # How long a key stays claimed by a request that never finishes
+
+# Live order feed (Served by 'order/feed.py' through 'OrderUp/asgi.py')
+# Events are stored in the database and polled by every worker, so feed clients on any worker receive every event
+# 'order.events.InProcessBroker' pushes instantly without the database, but only within one process (e.g. runserver)
+ORDER_EVENTS_BACKEND = getenv("ORDER_EVENTS_BACKEND", "order.events.DatabaseBroker")
+ORDER_EVENTS_POLL_SECONDS = float(getenv("ORDER_EVENTS_POLL_SECONDS", "1"))  # Delay before events reach feed clients
+ORDER_EVENTS_HISTORY = int(getenv("ORDER_EVENTS_HISTORY", "1000"))  # Events kept for clients resuming with an event id
+ORDER_FEED_HEARTBEAT_SECONDS = 15
+
+# Fulfilled orders older than this are moved to the archive by 'manage.py archive_orders' ('order/archive.py')
+ORDER_ARCHIVE_AFTER_HOURS = float(getenv("ORDER_ARCHIVE_AFTER_HOURS", "24"))
 
 # Django internationalization metadata for translations (Unused)
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
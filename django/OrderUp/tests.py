@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from cart.models import Cart
+from menu.models import MenuItem
+from order.models import ItemOrder, Order
+
+
+@override_settings(PERFORMANCE_BUDGET_MODE="raise")
+class QueryBudgetTests(TestCase):
+    """Requests to the hot endpoints with enough rows that a per-row query would exceed PERFORMANCE_QUERY_BUDGETS"""
+
+    def setUp(self):
+        self.items = [MenuItem.objects.create(name=f"Item {index}", description="") for index in range(5)]
+        Order.objects.bulk_create([Order(fulfilled=index % 2 == 0) for index in range(10)])
+        self.orders = list(Order.objects.order_by("order_number"))
+        ItemOrder.objects.bulk_create([
+            ItemOrder(order=order, item=item, count=1) for order in self.orders for item in self.items
+        ])
+        Cart.objects.create(cart_id="cart-1")
+
+    def post(self, path, body=None):
+        response = self.client.post(path, body or {}, content_type="application/json")
+        self.assertLess(response.status_code, 400, response.content)
+        return response
+
+    def test_budget_mode_raises(self):
+        self.assertEqual(settings.PERFORMANCE_BUDGET_MODE, "raise")
+
+    def test_read_endpoints(self):
+        for path in ("/order/list", "/order/history", "/order/stats", "/menu/list", "/cart/view/cart-1"):
+            self.assertEqual(self.client.get(path).status_code, 200, path)
+
+    def test_cart_endpoints(self):
+        self.post("/cart/patch", {"cart_id": "cart-1", "version": 0, "ops": [
+            {"op": "set", "item_id": item.item_id, "count": 2} for item in self.items
+        ]})
+        self.post("/cart/sync", {"cart_id": "cart-1", "items": [
+            {"item": {"item_id": item.item_id}, "count": 3} for item in self.items
+        ]})
+        # Placing is a GET in this API
+        response = self.client.get("/cart/place/cart-1")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_order_endpoints(self):
+        first, second, *rest = self.orders
+        self.post("/order/sync", {"order_number": first.order_number, "items": [
+            {"item": {"item_id": item.item_id}, "count": 2} for item in self.items
+        ]})
+        self.post(f"/order/fulfill/change/{first.order_number}", {"fulfilled": True})
+        self.post(f"/order/delete/{second.order_number}")
+        self.post("/order/batch", {"actions": [
+            {"order_number": order.order_number, "action": action}
+            for order, action in zip(rest, ("fulfill", "unfulfill", "delete") * 3)
+        ]})
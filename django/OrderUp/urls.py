@@ -13,11 +13,11 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf import settings
 from django.contrib import admin
 from django.shortcuts import render
-from django.urls import path, re_path, include
-from django.views.static import serve
+from django.urls import path, include
+
+from .instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),  # Default admin urls
@@ -28,7 +28,7 @@ urlpatterns = [
     path('cart/', include('cart.urls')),  # All things cart related
     path('order/', include('order.urls')),  # All things order related
     path('images/', include('images.urls')),  # All things image related
-    re_path(r'^react/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT}),
+    path('metrics', metrics_view),  # Per-route performance histograms (Local requests only)
 ]
 
 
@@ -0,0 +1,50 @@
+from random import Random
+
+from django.core.management import call_command
+
+from cart.models import Cart, CartItemOrder
+from menu.models import MenuItem
+from order.models import Order, ItemOrder
+
+# Items per generated cart or order are picked between these bounds
+MIN_LINES = 1
+MAX_LINES = 5
+
+
+def random_lines(rng, item_ids):
+    """Random (item_id, count) pairs for one cart or order"""
+    chosen = rng.sample(item_ids, min(len(item_ids), rng.randint(MIN_LINES, MAX_LINES)))
+    return [(item_id, rng.randint(1, 4)) for item_id in chosen]
+
+
+def seed_database(menu_items, carts, orders, seed=0):
+    """
+    Loads the menu and order fixtures, then bulk generates extra MenuItems, Carts and Orders on top of them
+    :return: Dictionary with the lists of item_ids and cart_ids available to the workload
+    """
+    rng = Random(seed)
+    call_command("loaddata", "menu-fixture", "order-fixture", verbosity=0)
+
+    MenuItem.objects.bulk_create([
+        MenuItem(name=f"Benchmark Item {index}", description=f"Generated menu item #{index} for benchmarking")
+        for index in range(menu_items)
+    ])
+    item_ids = list(MenuItem.objects.values_list("item_id", flat=True))
+
+    cart_ids = [f"bench-cart-{index}" for index in range(carts)]
+    Cart.objects.bulk_create([Cart(cart_id=cart_id) for cart_id in cart_ids])
+    CartItemOrder.objects.bulk_create([
+        CartItemOrder(cart_id=cart_id, item_id=item_id, count=count)
+        for cart_id in cart_ids
+        for item_id, count in random_lines(rng, item_ids)
+    ])
+
+    Order.objects.bulk_create([Order(fulfilled=rng.random() < 0.8) for _ in range(orders)])
+    new_orders = Order.objects.order_by("-order_number").values_list("order_number", flat=True)[:orders]
+    ItemOrder.objects.bulk_create([
+        ItemOrder(order_id=order_number, item_id=item_id, count=count)
+        for order_number in new_orders
+        for item_id, count in random_lines(rng, item_ids)
+    ], batch_size=1000)
+
+    return {"item_ids": item_ids, "cart_ids": cart_ids}
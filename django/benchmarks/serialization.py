@@ -0,0 +1,94 @@
+import time
+
+from django.db.models import Prefetch
+from django.http import JsonResponse
+
+from OrderUp.rendering import orjson_dumps, stdlib_dumps
+from cart.models import Cart, CartItemOrder
+from cart.serializers import CartSerializer
+from cart.stores import load_cart
+from menu.models import MenuItem
+from menu.serializers import MenuItemSerializer, menu_item_dicts
+from order.models import ItemOrder, Order
+from order.serializers import OrderSerializer, order_dicts
+
+# Carts rendered per round of the cart/view case
+CART_SAMPLE_SIZE = 50
+
+
+def drf_orders():
+    orders = Order.objects.prefetch_related(
+        Prefetch("items", queryset=ItemOrder.objects.select_related("item").order_by("id"))
+    ).order_by("order_number")
+    return JsonResponse({"orders": OrderSerializer(orders, many=True).data, "next_cursor": None}).content
+
+
+def fast_orders(encode):
+    return encode({"orders": order_dicts(Order.objects.order_by("order_number")), "next_cursor": None})
+
+
+def drf_menu():
+    return JsonResponse({"items": MenuItemSerializer(MenuItem.objects.all(), many=True).data}).content
+
+
+def fast_menu(encode):
+    return encode({"items": menu_item_dicts(MenuItem.objects.all())})
+
+
+def drf_carts(cart_ids):
+    carts = Cart.objects.prefetch_related(
+        Prefetch("items", queryset=CartItemOrder.objects.select_related("item").order_by("id"))
+    )
+    return [JsonResponse(CartSerializer(carts.get(cart_id=cart_id)).data).content for cart_id in cart_ids]
+
+
+def fast_carts(encode, cart_ids):
+    return [encode(load_cart(cart_id)[0]) for cart_id in cart_ids]
+
+
+def time_rounds(render, rounds):
+    """Returns (mean milliseconds per round, output of the last round)"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        output = render()
+    return (time.perf_counter() - start) * 1000 / rounds, output
+
+
+def compare_serializers(rounds):
+    """
+    Renders the order list, the menu and a sample of carts with the DRF serializers and JsonResponse, then with
+    the .values() builders and each available JSON encoder
+    :return: Dictionary of case to {"drf_ms": ..., "<encoder>_ms": ..., "identical": ...}. identical tells whether
+             the stdlib output is byte-for-byte the same as the DRF output
+    """
+    encoders = {"stdlib": stdlib_dumps}
+    try:
+        import orjson  # noqa: F401 (optional)
+        encoders["orjson"] = orjson_dumps
+    except ImportError:
+        pass
+
+    cart_ids = list(Cart.objects.order_by("cart_id").values_list("cart_id", flat=True)[:CART_SAMPLE_SIZE])
+    cases = {
+        "order/list": (drf_orders, lambda encode: fast_orders(encode)),
+        "menu/list": (drf_menu, lambda encode: fast_menu(encode)),
+        f"cart/view x{len(cart_ids)}": (lambda: drf_carts(cart_ids), lambda encode: fast_carts(encode, cart_ids)),
+    }
+
+    results = {}
+    for case, (drf_render, fast_render) in cases.items():
+        drf_ms, drf_output = time_rounds(drf_render, rounds)
+        results[case] = {"drf_ms": round(drf_ms, 3)}
+        for name, encode in encoders.items():
+            fast_ms, fast_output = time_rounds(lambda: fast_render(encode), rounds)
+            results[case][f"{name}_ms"] = round(fast_ms, 3)
+            if name == "stdlib":
+                results[case]["identical"] = fast_output == drf_output
+    return results
+
+
+def print_comparison(results):
+    columns = [column for column in next(iter(results.values()), {}) if column != "identical"]
+    print(f"\n{'serialization':<22}" + "".join(f"{column:>12}" for column in columns) + f"{'identical':>11}")
+    for case, stats in results.items():
+        print(f"{case:<22}" + "".join(f"{stats[column]:>12}" for column in columns) + f"{str(stats['identical']):>11}")
@@ -0,0 +1,153 @@
+import json
+import math
+import threading
+import time
+from random import Random
+
+from django.db import connection
+from django.test import Client
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.query_counts = []
+        self.errors = 0
+
+    def add(self, latency_ms, query_count, status_code):
+        self.latencies_ms.append(latency_ms)
+        self.query_counts.append(query_count)
+        if status_code >= 500:
+            self.errors += 1
+
+    def merge(self, other):
+        self.latencies_ms.extend(other.latencies_ms)
+        self.query_counts.extend(other.query_counts)
+        self.errors += other.errors
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class BenchmarkClient:
+    """Test client that times each request and counts its queries per endpoint label"""
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+        self.stats = {}
+        self._query_count = 0
+
+    def _count_query(self, execute, sql, params, many, context):
+        self._query_count += 1
+        return execute(sql, params, many, context)
+
+    def request(self, label, method, path, payload=None):
+        self._query_count = 0
+        start = time.perf_counter()
+        with connection.execute_wrapper(self._count_query):
+            if method == "GET":
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, json.dumps(payload or {}), content_type="application/json")
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.stats.setdefault(label, EndpointStats()).add(latency_ms, self._query_count, response.status_code)
+        return response
+
+
+def run_customer(client, rng, cart_id, item_ids, iterations):
+    """A customer viewing their cart, changing quantities a few times and placing the order"""
+    for _ in range(iterations):
+        response = client.request("cart/view", "GET", f"/cart/view/{cart_id}")
+        if response.status_code != 200:
+            continue
+        items = response.json()["items"]
+        for _ in range(rng.randint(1, 4)):
+            # Mimics CartData.js: every quantity click uploads the entire cart
+            if items and rng.random() < 0.5:
+                rng.choice(items)["count"] = rng.randint(0, 4)
+            else:
+                items.append({"item": {"item_id": rng.choice(item_ids)}, "count": 1})
+            items = [cart_item for cart_item in items if cart_item["count"] > 0]
+            client.request("cart/sync", "POST", "/cart/sync", {"cart_id": cart_id, "items": items})
+        client.request("cart/place", "GET", f"/cart/place/{cart_id}")
+
+
+def run_kitchen_screen(client, rng, iterations):
+    """A kitchen screen reloading the open queue and fulfilling one of the orders on it"""
+    for _ in range(iterations):
+        response = client.request("order/list", "GET", "/order/list?fulfilled=false")
+        if response.status_code != 200:
+            continue
+        open_orders = response.json()["orders"]
+        if open_orders:
+            order_number = rng.choice(open_orders)["order_number"]
+            client.request("order/fulfill/change", "POST", f"/order/fulfill/change/{order_number}", {"fulfilled": True})
+
+
+def run_workload(seeded, customers, screens, customer_iterations, screen_iterations, seed=0):
+    """
+    Runs customers and kitchen screens concurrently, one thread each with its own database connection
+    :return: (Dictionary of endpoint label to merged EndpointStats, wall time in seconds)
+    """
+    clients = []
+    failures = []
+
+    def worker(target, *args):
+        client = BenchmarkClient()
+        clients.append(client)
+        try:
+            target(client, *args)
+        except Exception as err:
+            failures.append(err)
+        finally:
+            connection.close()
+
+    threads = []
+    for index in range(customers):
+        cart_id = seeded["cart_ids"][index % len(seeded["cart_ids"])]
+        threads.append(threading.Thread(target=worker, args=(
+            run_customer, Random(seed + index), cart_id, seeded["item_ids"], customer_iterations
+        )))
+    for index in range(screens):
+        threads.append(threading.Thread(target=worker, args=(
+            run_kitchen_screen, Random(seed + customers + index), screen_iterations
+        )))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - start
+
+    if failures:
+        raise RuntimeError(f"{len(failures)} benchmark worker(s) failed. First failure: {failures[0]!r}")
+
+    merged = {}
+    for client in clients:
+        for label, stats in client.stats.items():
+            merged.setdefault(label, EndpointStats()).merge(stats)
+    return merged, wall_seconds
+
+
+def summarize(merged, wall_seconds):
+    """Throughput, latency percentiles and query counts per endpoint"""
+    summary = {}
+    for label, stats in sorted(merged.items()):
+        latencies = sorted(stats.latencies_ms)
+        summary[label] = {
+            "requests": len(latencies),
+            "errors": stats.errors,
+            "throughput_rps": round(len(latencies) / wall_seconds, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "mean_queries": round(sum(stats.query_counts) / len(stats.query_counts), 2),
+            "max_queries": max(stats.query_counts),
+        }
+    return summary
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItemOrder
+
+# Carts deleted per transaction. Keeps each delete (and its locks) short while customers are shopping
+CART_GC_BATCH_SIZE = 1000
+
+
+def gc_batch(cutoff, batch_size=CART_GC_BATCH_SIZE):
+    """
+    Deletes one batch of carts last touched before the cutoff, and their items, in a single transaction
+    :return: (Number of carts deleted, number of cart items deleted). (0, 0) once nothing is left to delete
+    """
+    with transaction.atomic():
+        # Locked so a cart touched concurrently is either deleted first or left alone
+        cart_ids = list(
+            Cart.objects.filter(last_touched__lt=cutoff).select_for_update().order_by("last_touched")
+            .values_list("cart_id", flat=True)[:batch_size]
+        )
+        if not cart_ids:
+            return 0, 0
+        # Cascades to CartItemOrder through the cart__in index
+        deleted, deleted_by_model = Cart.objects.filter(cart_id__in=cart_ids).delete()
+    return deleted_by_model.get(Cart._meta.label, 0), deleted_by_model.get(CartItemOrder._meta.label, 0)
+
+
+def gc_carts(older_than, batch_size=CART_GC_BATCH_SIZE):
+    """
+    Deletes every cart untouched for longer than older_than, one batch at a time
+    :param older_than: timedelta since Cart.last_touched
+    :return: (Number of carts deleted, number of cart items deleted)
+    """
+    cutoff = timezone.now() - older_than
+    carts = items = 0
+    while True:
+        batch_carts, batch_items = gc_batch(cutoff, batch_size)
+        if not batch_carts:
+            return carts, items
+        carts += batch_carts
+        items += batch_items
@@ -0,0 +1,23 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cart.gc import CART_GC_BATCH_SIZE, gc_carts
+
+
+class Command(BaseCommand):
+    help = "Deletes abandoned carts and their items (e.g. nightly from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=float, default=settings.CART_EXPIRE_AFTER_DAYS,
+                            help="Only delete carts untouched for at least this many days")
+        parser.add_argument("--batch-size", type=int, default=CART_GC_BATCH_SIZE, help="Carts deleted per transaction")
+
+    def handle(self, *args, older_than_days, batch_size, **options):
+        start = time.perf_counter()
+        carts, items = gc_carts(timedelta(days=older_than_days), batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {carts} Carts With {items} Items In {time.perf_counter() - start:.2f}s"
+        ))
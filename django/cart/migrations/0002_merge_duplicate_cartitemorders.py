@@ -0,0 +1,31 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:08
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cartitemorders(apps, schema_editor):
+    """Folds duplicate (cart, item) rows into the oldest row with their counts summed before the unique constraint"""
+    CartItemOrder = apps.get_model('cart', 'CartItemOrder')
+    duplicates = (
+        CartItemOrder.objects
+        .values('cart_id', 'item_id')
+        .annotate(row_count=Count('id'), total=Sum('count'), keep_id=Min('id'))
+        .filter(row_count__gt=1)
+    )
+    for duplicate in duplicates:
+        CartItemOrder.objects.filter(id=duplicate['keep_id']).update(count=duplicate['total'])
+        CartItemOrder.objects.filter(
+            cart_id=duplicate['cart_id'], item_id=duplicate['item_id']
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cartitemorders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_merge_duplicate_cartitemorders'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cartitemorder',
+            constraint=models.UniqueConstraint(fields=('cart', 'item'), name='unique_cart_item'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:26
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_cart_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_touched',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,11 +1,24 @@
 from django.db import models
+from django.utils import timezone
+
 from order.models import ItemOrderTemplate
 
 
 class Cart(models.Model):
     cart_id = models.CharField(max_length=100, null=False, blank=False, unique=True, primary_key=True)
+    # Incremented on every change to the cart's items. Patches must name the version they were made against
+    version = models.PositiveIntegerField(default=0, null=False, blank=False)
+    # Last time the cart was viewed or changed, kept to within CART_TOUCH_INTERVAL_SECONDS. Expired carts are deleted
+    # by 'manage.py gc_carts'
+    last_touched = models.DateTimeField(default=timezone.now, null=False, blank=False, db_index=True)
     # Use Cart.items to access all CartItemOrder instances
 
 
 class CartItemOrder(ItemOrderTemplate):
     cart = models.ForeignKey(Cart, models.CASCADE, null=False, blank=False, related_name="items")
+
+    class Meta(ItemOrderTemplate.Meta):
+        constraints = [
+            # Each menu item appears once per cart. Also the index behind (cart, item) lookups and upserts
+            models.UniqueConstraint(fields=["cart", "item"], name="unique_cart_item"),
+        ]
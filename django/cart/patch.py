@@ -0,0 +1,111 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from menu.models import MenuItem
+from .models import Cart, CartItemOrder
+
+PATCH_OPS = ("set", "inc", "remove")
+# Upper bound for the number of operations in a single patch
+PATCH_MAX_OPS = 100
+
+
+class PatchError(Exception):
+    """Raised for malformed patches. The message is safe to return to the client"""
+
+
+class VersionConflict(Exception):
+    """Raised when the cart version sent with a patch is not the current version"""
+
+
+def parse_ops(raw_ops):
+    """
+    Validates the operations of a patch
+    :param raw_ops: List of {"op": "set", "item_id": ..., "count": ...}, {"op": "inc", "item_id": ..., "by": ...}
+                    (by defaults to 1 and may be negative) or {"op": "remove", "item_id": ...} dictionaries
+    :return: List of (op, item_id, amount) tuples. amount is None for remove
+    :raises PatchError: If an operation is malformed
+    """
+    if not isinstance(raw_ops, list) or not raw_ops:
+        raise PatchError("Patch Must Contain A List Of Operations")
+    if len(raw_ops) > PATCH_MAX_OPS:
+        raise PatchError(f"Patch Cannot Contain More Than {PATCH_MAX_OPS} Operations")
+
+    ops = []
+    for raw_op in raw_ops:
+        if not isinstance(raw_op, dict):
+            raise PatchError(f"Malformed Patch Operation {raw_op}")
+        op = raw_op.get("op")
+        if op not in PATCH_OPS:
+            raise PatchError(f"Unknown Patch Operation [{op}]")
+        try:
+            item_id = int(raw_op["item_id"])
+            if op == "set":
+                amount = int(raw_op["count"])
+            elif op == "inc":
+                amount = int(raw_op.get("by", 1))
+            else:
+                amount = None
+        except (KeyError, TypeError, ValueError):
+            raise PatchError(f"Malformed Patch Operation {raw_op}")
+        ops.append((op, item_id, amount))
+    return ops
+
+
+def _increment_or_insert(cart_id, item_id, amount):
+    """Adds a positive amount to a cart item in one statement, inserting the item if it is not in the cart yet"""
+    table = connection.ops.quote_name(CartItemOrder._meta.db_table)
+    with connection.cursor() as cursor:
+        # Supported as-is by both SQLite (3.24+) and PostgreSQL
+        cursor.execute(
+            f'INSERT INTO {table} ("cart_id", "item_id", "count") VALUES (%s, %s, %s) '
+            f'ON CONFLICT ("cart_id", "item_id") DO UPDATE SET "count" = {table}."count" + excluded."count"',
+            [cart_id, item_id, amount]
+        )
+
+
+def apply_ops(cart_id, version, ops):
+    """
+    Applies parsed operations to a cart if it is still at the given version, one statement per operation
+    :return: The new cart version
+    :raises Cart.DoesNotExist: If the cart does not exist
+    :raises MenuItem.DoesNotExist: If an operation adds an item that is not on the menu. Nothing is changed
+    :raises VersionConflict: If the cart is not at the given version. Nothing is changed
+    """
+    added_item_ids = {item_id for op, item_id, amount in ops if op in ("set", "inc") and amount > 0}
+    if added_item_ids:
+        found_item_ids = set(MenuItem.objects.filter(item_id__in=added_item_ids).values_list("item_id", flat=True))
+        missing_item_ids = sorted(added_item_ids - found_item_ids)
+        if missing_item_ids:
+            raise MenuItem.DoesNotExist(f"Menu Items Not Found {missing_item_ids}")
+
+    with transaction.atomic():
+        # Compare-and-swap on the version. Also takes the cart's write lock until the patch commits
+        if not Cart.objects.filter(cart_id=cart_id, version=version).update(
+            version=F("version") + 1, last_touched=timezone.now()
+        ):
+            if not Cart.objects.filter(cart_id=cart_id).exists():
+                raise Cart.DoesNotExist(f"Cart [{cart_id}] Not Found")
+            raise VersionConflict(f"Cart [{cart_id}] Is Not At Version {version}")
+
+        cart_items = CartItemOrder.objects.filter(cart_id=cart_id)
+        may_reach_zero = False
+        for op, item_id, amount in ops:
+            if op == "remove" or (op == "set" and amount <= 0):
+                cart_items.filter(item_id=item_id).delete()
+            elif op == "set":
+                CartItemOrder.objects.bulk_create(
+                    [CartItemOrder(cart_id=cart_id, item_id=item_id, count=amount)],
+                    update_conflicts=True, unique_fields=["cart", "item"], update_fields=["count"]
+                )
+            elif amount > 0:
+                _increment_or_insert(cart_id, item_id, amount)
+            elif amount < 0:
+                # Decrementing an item that is not in the cart is a no-op, so no insert is needed
+                cart_items.filter(item_id=item_id).update(count=Greatest(F("count") + amount, 0))
+                may_reach_zero = True
+        if may_reach_zero:
+            cart_items.filter(count__lte=0).delete()
+
+    return version + 1
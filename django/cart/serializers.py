@@ -16,4 +16,4 @@ class CartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cart
-        fields = ["cart_id", "items"]
+        fields = ["cart_id", "version", "items"]
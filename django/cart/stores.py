@@ -0,0 +1,370 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from OrderUp.instrumentation import timed
+from menu.cache import get_menu_items
+from order.models import MenuItem
+from order.serializers import item_order_dicts
+from order.sync import diff_counts, posted_counts, sync_item_orders
+from .models import Cart, CartItemOrder
+from .patch import VersionConflict, apply_ops
+
+logger = logging.getLogger(__name__)
+
+
+class CartBusy(Exception):
+    """Raised when a cart stays locked by another request for longer than CART_LOCK_WAIT_SECONDS"""
+
+
+class CartStore:
+    """
+    Interface for where carts live between changes. Set CART_STORE to swap implementations
+    Carts are returned as plain dicts, in the same format as CartSerializer
+    """
+
+    def view(self, cart_id):
+        """Returns (serialized cart, True if it was just created). Creates an empty cart if it does not exist"""
+        raise NotImplementedError
+
+    def current(self, cart_id):
+        """
+        Returns the serialized cart
+        :raises Cart.DoesNotExist: If the cart does not exist
+        """
+        raise NotImplementedError
+
+    def sync(self, cart_id, posted_items, expected_version=None):
+        """
+        Overwrites the items of a cart with the posted items (see order.sync.sync_item_orders)
+        :return: Dictionary of changed item_ids mapped to their (old count, new count)
+        :raises Cart.DoesNotExist: If the cart does not exist
+        :raises MenuItem.DoesNotExist: If a posted item is not on the menu. Nothing is changed
+        :raises VersionConflict: If expected_version is given and the cart is not at it. Nothing is changed
+        """
+        raise NotImplementedError
+
+    def patch(self, cart_id, version, ops):
+        """Applies operations parsed by cart.patch.parse_ops. Same results and exceptions as cart.patch.apply_ops"""
+        raise NotImplementedError
+
+    @contextmanager
+    def checkout(self, cart_id):
+        """
+        Yields the cart's (item_id, count) list with the body running in a database transaction
+        The cart is emptied if it had items and the body finishes without raising
+        :raises Cart.DoesNotExist: If the cart does not exist
+        :raises MenuItem.DoesNotExist: If the cart holds items that are no longer on the menu. Nothing is changed
+        """
+        raise NotImplementedError
+        yield
+
+    def empty(self, cart_id):
+        raise NotImplementedError
+
+
+def load_cart(cart_id):
+    """
+    Reads a cart in the format of CartSerializer with two queries, without instantiating models or serializers
+    :return: (Serialized cart, its last_touched)
+    :raises Cart.DoesNotExist: If the cart does not exist
+    """
+    cart = Cart.objects.values("cart_id", "version", "last_touched").get(cart_id=cart_id)
+    last_touched = cart.pop("last_touched")
+    cart["items"] = [
+        item_order for parent_id, item_order in item_order_dicts(CartItemOrder.objects.filter(cart_id=cart_id), "cart_id")
+    ]
+    return cart, last_touched
+
+
+def touch_due(last_touched):
+    """True if a cart last touched at the given time should be touched again when viewed"""
+    return last_touched < timezone.now() - timedelta(seconds=settings.CART_TOUCH_INTERVAL_SECONDS)
+
+
+class DatabaseCartStore(CartStore):
+    """Every cart read and write goes straight to the Cart and CartItemOrder tables"""
+
+    def view(self, cart_id):
+        try:
+            cart, last_touched = load_cart(cart_id)
+        except Cart.DoesNotExist:
+            cart = Cart.objects.create(cart_id=cart_id)
+            return {"cart_id": cart.cart_id, "version": cart.version, "items": []}, True
+        if touch_due(last_touched):
+            Cart.objects.filter(cart_id=cart_id).update(last_touched=timezone.now())
+        return cart, False
+
+    def current(self, cart_id):
+        return load_cart(cart_id)[0]
+
+    def sync(self, cart_id, posted_items, expected_version=None):
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().get(cart_id=cart_id)
+            if expected_version is not None and cart.version != expected_version:
+                raise VersionConflict(f"Cart [{cart_id}] Is Not At Version {expected_version}")
+            changes = sync_item_orders(CartItemOrder, "cart", cart, posted_items)
+            if changes:
+                Cart.objects.filter(cart_id=cart_id).update(version=F("version") + 1, last_touched=timezone.now())
+            elif touch_due(cart.last_touched):
+                Cart.objects.filter(cart_id=cart_id).update(last_touched=timezone.now())
+        return changes
+
+    def patch(self, cart_id, version, ops):
+        return apply_ops(cart_id, version, ops)
+
+    @contextmanager
+    def checkout(self, cart_id):
+        with transaction.atomic():
+            # Lock the cart so concurrent checkouts (e.g. a double click) wait here and then see an emptied cart
+            cart = Cart.objects.select_for_update().get(cart_id=cart_id)
+            cart_items = list(cart.items.values_list("item_id", "count"))
+            yield cart_items
+            if cart_items:
+                CartItemOrder.objects.filter(cart=cart).delete()
+                Cart.objects.filter(cart_id=cart_id).update(version=F("version") + 1, last_touched=timezone.now())
+
+    def empty(self, cart_id):
+        with transaction.atomic():
+            CartItemOrder.objects.filter(cart__cart_id=cart_id).delete()
+            # A new version, same as checkout, so changes made against the old items conflict
+            Cart.objects.filter(cart_id=cart_id).update(version=F("version") + 1, last_touched=timezone.now())
+
+
+class CacheCartStore(CartStore):
+    """
+    Keeps carts in Django's cache and writes changed carts to the Cart tables in the background (write-behind)
+    Viewing and changing a cart then needs no database queries. Checking out writes the emptied cart immediately
+    Carts missing from the cache (e.g. evicted or saved by DatabaseCartStore) are read through from the tables
+    Needs a cache shared by every worker (e.g. REDIS_URL) since each cart must have a single copy
+    """
+
+    def __init__(self):
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._flusher = None
+        # Writes the carts changed since the last flush when the process stops
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _key(cart_id):
+        return f"cart:{cart_id}"
+
+    @contextmanager
+    def _locked(self, cart_id, wait_seconds=None):
+        """
+        Serializes changes to one cart across every worker sharing the cache
+        :param wait_seconds: How long to wait for another holder. Defaults to CART_LOCK_WAIT_SECONDS
+        :raises CartBusy: If the lock is still held after waiting
+        """
+        lock_key = f"cart:lock:{cart_id}"
+        deadline = time.monotonic() + (settings.CART_LOCK_WAIT_SECONDS if wait_seconds is None else wait_seconds)
+        # The timeout frees the lock if its holder dies
+        while not cache.add(lock_key, True, timeout=settings.CART_LOCK_WAIT_SECONDS * 2):
+            if time.monotonic() > deadline:
+                raise CartBusy(f"Cart [{cart_id}] Is Busy")
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            cache.delete(lock_key)
+
+    def _load(self, cart_id):
+        """
+        Returns the cart's {"version": ..., "touched": ..., "items": {item_id: count}} state, reading it from the
+        tables on a miss. touched is last_touched as a POSIX timestamp
+        :raises Cart.DoesNotExist: If the cart is neither cached nor stored
+        """
+        state = cache.get(self._key(cart_id))
+        if state is None:
+            cart = Cart.objects.get(cart_id=cart_id)
+            state = {
+                "version": cart.version,
+                "touched": cart.last_touched.timestamp(),
+                "items": dict(cart.items.order_by("id").values_list("item_id", "count")),
+            }
+            cache.add(self._key(cart_id), state, timeout=settings.CART_CACHE_TIMEOUT)
+        return state
+
+    def _save(self, cart_id, state):
+        cache.set(self._key(cart_id), state, timeout=settings.CART_CACHE_TIMEOUT)
+        with self._dirty_lock:
+            self._dirty.add(cart_id)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_forever, name="cart-flusher", daemon=True)
+                self._flusher.start()
+
+    @staticmethod
+    def _serialize(cart_id, state):
+        with timed("serialize"):
+            menu_items = get_menu_items()
+            return {
+                "cart_id": cart_id,
+                "version": state["version"],
+                # Items removed from the menu since they were added are left out
+                "items": [
+                    {"item": menu_items[item_id], "count": count}
+                    for item_id, count in state["items"].items() if item_id in menu_items
+                ],
+            }
+
+    @staticmethod
+    def _check_menu(item_ids):
+        missing_item_ids = sorted(set(item_ids) - get_menu_items().keys())
+        if missing_item_ids:
+            raise MenuItem.DoesNotExist(f"Menu Items Not Found {missing_item_ids}")
+
+    @staticmethod
+    def _write(cart_id, state):
+        """Overwrites the stored copy of a cart with its cached state"""
+        menu_items = get_menu_items()
+        with transaction.atomic():
+            cart, created = Cart.objects.update_or_create(cart_id=cart_id, defaults={
+                "version": state["version"],
+                "last_touched": datetime.fromtimestamp(state["touched"], dt_timezone.utc),
+            })
+            sync_item_orders(CartItemOrder, "cart", cart, [
+                {"item": {"item_id": item_id}, "count": count}
+                for item_id, count in state["items"].items() if item_id in menu_items
+            ])
+
+    @staticmethod
+    def _touch_due(state):
+        return touch_due(datetime.fromtimestamp(state["touched"], dt_timezone.utc))
+
+    def _touch(self, cart_id):
+        """Updates a viewed cart's touched time, unless a change (which touches it anyway) holds the lock"""
+        try:
+            with self._locked(cart_id, wait_seconds=0):
+                self._save(cart_id, {**self._load(cart_id), "touched": time.time()})
+        except CartBusy:
+            pass
+
+    def view(self, cart_id):
+        try:
+            state = self._load(cart_id)
+        except Cart.DoesNotExist:
+            state = {"version": 0, "touched": time.time(), "items": {}}
+            if not cache.add(self._key(cart_id), state, timeout=settings.CART_CACHE_TIMEOUT):
+                # Created by a concurrent request
+                return self._serialize(cart_id, self._load(cart_id)), False
+            self._save(cart_id, state)
+            return self._serialize(cart_id, state), True
+        if self._touch_due(state):
+            self._touch(cart_id)
+        return self._serialize(cart_id, state), False
+
+    def current(self, cart_id):
+        return self._serialize(cart_id, self._load(cart_id))
+
+    def sync(self, cart_id, posted_items, expected_version=None):
+        with self._locked(cart_id):
+            state = self._load(cart_id)
+            if expected_version is not None and state["version"] != expected_version:
+                raise VersionConflict(f"Cart [{cart_id}] Is Not At Version {expected_version}")
+            changes = diff_counts(state["items"], posted_counts(posted_items))
+            self._check_menu(item_id for item_id in changes if item_id not in state["items"])
+            if changes:
+                items = dict(state["items"])
+                for item_id, (old_count, new_count) in changes.items():
+                    if new_count > 0:
+                        items[item_id] = new_count
+                    else:
+                        items.pop(item_id)
+                self._save(cart_id, {"version": state["version"] + 1, "touched": time.time(), "items": items})
+            elif self._touch_due(state):
+                self._save(cart_id, {**state, "touched": time.time()})
+        return changes
+
+    def patch(self, cart_id, version, ops):
+        with self._locked(cart_id):
+            state = self._load(cart_id)
+            if state["version"] != version:
+                raise VersionConflict(f"Cart [{cart_id}] Is Not At Version {version}")
+            self._check_menu(item_id for op, item_id, amount in ops if op in ("set", "inc") and amount > 0)
+            items = dict(state["items"])
+            for op, item_id, amount in ops:
+                new_count = 0 if op == "remove" else amount if op == "set" else items.get(item_id, 0) + amount
+                if new_count > 0:
+                    items[item_id] = new_count
+                else:
+                    items.pop(item_id, None)
+            self._save(cart_id, {"version": version + 1, "touched": time.time(), "items": items})
+        return version + 1
+
+    @contextmanager
+    def checkout(self, cart_id):
+        with self._locked(cart_id):
+            state = self._load(cart_id)
+            cart_items = list(state["items"].items())
+            with transaction.atomic():
+                # Cached items are not removed along with menu items, unlike CartItemOrder rows. Checked here so
+                # placing the cart fails with the missing items instead of an IntegrityError
+                if cart_items:
+                    item_ids = {item_id for item_id, count in cart_items}
+                    missing_item_ids = sorted(
+                        item_ids - set(MenuItem.objects.filter(item_id__in=item_ids).values_list("item_id", flat=True))
+                    )
+                    if missing_item_ids:
+                        raise MenuItem.DoesNotExist(f"Menu Items Not Found {missing_item_ids}")
+                yield cart_items
+                if cart_items:
+                    now = timezone.now()
+                    state = {"version": state["version"] + 1, "touched": now.timestamp(), "items": {}}
+                    # Placed orders are durable, so the emptied cart is stored with them instead of written behind
+                    CartItemOrder.objects.filter(cart_id=cart_id).delete()
+                    if not Cart.objects.filter(cart_id=cart_id).update(version=state["version"], last_touched=now):
+                        Cart.objects.create(cart_id=cart_id, version=state["version"], last_touched=now)
+            if cart_items:
+                cache.set(self._key(cart_id), state, timeout=settings.CART_CACHE_TIMEOUT)
+                with self._dirty_lock:
+                    self._dirty.discard(cart_id)
+
+    def empty(self, cart_id):
+        with self._locked(cart_id):
+            state = self._load(cart_id)
+            self._save(cart_id, {**state, "version": state["version"] + 1, "items": {}})
+
+    def flush(self):
+        """Writes every cart changed by this process since the last flush to the tables. Returns the number written"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        written = 0
+        for cart_id in dirty:
+            try:
+                with self._locked(cart_id):
+                    state = cache.get(self._key(cart_id))
+                    if state is not None:
+                        self._write(cart_id, state)
+                        written += 1
+            except Exception:
+                logger.exception("Cart Flush Failed [%s]", cart_id)
+                with self._dirty_lock:
+                    self._dirty.add(cart_id)
+        return written
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(settings.CART_FLUSH_SECONDS)
+            # Nothing closes this thread's connection between flushes the way request boundaries do
+            close_old_connections()
+            written = self.flush()
+            if written:
+                logger.debug("Carts Flushed [%s]", written)
+
+
+@lru_cache(maxsize=None)
+def get_cart_store():
+    """Returns the process-wide cart store configured by CART_STORE"""
+    return import_string(getattr(settings, "CART_STORE", "cart.stores.DatabaseCartStore"))()
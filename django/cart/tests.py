@@ -0,0 +1,81 @@
+import time
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from menu.models import MenuItem
+from order.models import Order
+from .models import Cart, CartItemOrder
+from .patch import VersionConflict
+from .stores import CacheCartStore, DatabaseCartStore, get_cart_store
+
+
+class CartValidationTests(TestCase):
+    def setUp(self):
+        Cart.objects.create(cart_id="cart-1")
+
+    def post(self, path, body):
+        return self.client.post(path, body, content_type="application/json")
+
+    def test_patch_rejects_operations_that_are_not_objects(self):
+        response = self.post("/cart/patch", {"cart_id": "cart-1", "version": 0, "ops": [1]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_patch_rejects_bodies_that_are_not_objects(self):
+        for body in ([1], "cart-1", 1):
+            self.assertEqual(self.post("/cart/patch", body).status_code, 400)
+
+    def test_sync_converts_the_version(self):
+        response = self.post("/cart/sync", {"cart_id": "cart-1", "items": [], "version": "0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cart.objects.get().version, 0)
+
+    def test_sync_rejects_invalid_versions(self):
+        response = self.post("/cart/sync", {"cart_id": "cart-1", "items": [], "version": "latest"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sync_rejects_bodies_that_are_not_objects(self):
+        self.assertEqual(self.post("/cart/sync", [1]).status_code, 400)
+
+
+class DatabaseCartStoreTests(TestCase):
+    def setUp(self):
+        self.item = MenuItem.objects.create(name="Cake", description="A cake")
+        self.store = DatabaseCartStore()
+        Cart.objects.create(cart_id="cart-1")
+        self.store.patch("cart-1", 0, [("set", self.item.item_id, 2)])
+
+    def test_empty_starts_a_new_version(self):
+        self.store.empty("cart-1")
+
+        self.assertFalse(CartItemOrder.objects.exists())
+        self.assertEqual(Cart.objects.get().version, 2)
+        with self.assertRaises(VersionConflict):
+            self.store.patch("cart-1", 1, [("inc", self.item.item_id, 1)])
+        with self.assertRaises(VersionConflict):
+            self.store.sync("cart-1", [{"item": {"item_id": self.item.item_id}, "count": 1}], expected_version=1)
+
+
+@override_settings(CART_STORE="cart.stores.CacheCartStore",
+                   CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CacheCartStoreTests(TestCase):
+    def setUp(self):
+        get_cart_store.cache_clear()
+        self.addCleanup(get_cart_store.cache_clear)
+        self.item = MenuItem.objects.create(name="Cake", description="A cake")
+        Cart.objects.create(cart_id="cart-1")
+        # Cached directly, as a cart changed before the flusher wrote it to the tables
+        cache.set(CacheCartStore._key("cart-1"), {"version": 1, "touched": time.time(), "items": {self.item.item_id: 2}})
+
+    def test_placing_a_cart_with_a_deleted_menu_item_is_rejected(self):
+        item_id = self.item.item_id
+        self.item.delete()
+
+        response = self.client.get("/cart/place/cart-1")
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(str(item_id), response.content.decode())
+        self.assertFalse(Order.objects.exists())
+
+    def test_placing_a_cart(self):
+        self.assertEqual(self.client.get("/cart/place/cart-1").status_code, 200)
+        self.assertEqual(Order.objects.get().items.get().count, 2)
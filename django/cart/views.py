@@ -1,98 +1,160 @@
 import json
+import logging
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponse, JsonResponse
 from rest_framework.decorators import api_view
 
+from OrderUp.idempotency import idempotent
+from OrderUp.rendering import json_response
+from order.events import ORDER_CREATED, publish_order_event
 from order.models import Order, ItemOrder, MenuItem
-from .models import Cart, CartItemOrder
-from .serializers import CartSerializer
+from order.stats import record_sales
+from .models import Cart
+from .patch import PatchError, VersionConflict, parse_ops
+from .stores import CartBusy, get_cart_store
+
+logger = logging.getLogger(__name__)
 
 
 @api_view(["GET"])
 def get_cart(request, cart_id):
     """Returns the current cart if it exists. Creates the card first if it doesn't"""
     # TODO: Self-chosen cart_id for now. Assign based on user in the future
-    try:
-        cart = Cart.objects.get(cart_id=cart_id)
-        print(f"Cart located [{cart.cart_id}]")
-    except ObjectDoesNotExist:
-        cart = Cart(cart_id=cart_id)
-        cart.save()
-        print(f"New cart created [{cart.cart_id}]")
+    cart, created = get_cart_store().view(cart_id)
+    if created:
+        logger.info("New Cart Created [%s]", cart_id)
+    else:
+        logger.debug("Cart Located [%s]", cart_id)
+    return json_response(cart)
+
 
-    # print(f"Info: {CartSerializer(cart).data}")
-    return JsonResponse(CartSerializer(cart).data)
+def cart_busy_response(err):
+    response = HttpResponse(str(err), status=503)
+    response["Retry-After"] = "1"
+    return response
 
 
 @api_view(["GET"])
+@idempotent
 def place_order(request, cart_id):
-    """Finalizes and places cart as an order"""
-    # Convert all cart items into order items
-    print(f"Attempting to place [{cart_id}] as an Order")
-
-    # Creates a new order
-    finalized_order = Order()
-    finalized_order.save()
-    cart_obj = Cart.objects.get(cart_id=cart_id)
-    for itemEntry in list(cart_obj.items.all()):
-        print(f"Moving Item From Cart: [{itemEntry.item.name}]")
-        order_item = ItemOrder(order=finalized_order, item=itemEntry.item, count=itemEntry.count)
-        order_item.save()
-
-    # Converted all cart items into order items
-    print(f"Placed [{cart_id}] as an Order")
-    # Empty the cart. Cart itself is not deleted
-    # Note: No indication is sent to the front end to empty the cart
-    #       Remember to reload the cart or re-empty it there to match
-    cart_obj.items.all().delete()
+    """
+    Finalizes and places cart as an order in a single transaction
+    Send an Idempotency-Key header to make retries safe. Repeats replay the first response instead of placing again
+    """
+    logger.debug("Attempting To Place [%s] As An Order", cart_id)
 
+    try:
+        with get_cart_store().checkout(cart_id) as cart_items:
+            if not cart_items:
+                return HttpResponse(f"Cart [{cart_id}] Is Empty", status=409)
+
+            # Convert all cart items into order items
+            finalized_order = Order.objects.create()
+            ItemOrder.objects.bulk_create([
+                ItemOrder(order=finalized_order, item_id=item_id, count=count) for item_id, count in cart_items
+            ])
+            record_sales(
+                [(finalized_order.placed_at, item_id, count) for item_id, count in cart_items],
+                [finalized_order.placed_at]
+            )
+            # The cart is emptied by the store once this block finishes. Cart itself is not deleted
+            # Note: No indication is sent to the front end to empty the cart
+            #       Remember to reload the cart or re-empty it there to match
+
+            publish_order_event(ORDER_CREATED, {
+                "order_number": finalized_order.order_number,
+                "items": [{"item_id": item_id, "count": count} for item_id, count in cart_items]
+            })
+    except Cart.DoesNotExist:
+        return HttpResponse(f"Cart [{cart_id}] Not Found", status=404)
+    except MenuItem.DoesNotExist as err:
+        return HttpResponse(str(err), status=404)
+    except CartBusy as err:
+        return cart_busy_response(err)
+
+    logger.info("Placed [%s] As Order [%s] With %s Item(s)", cart_id, finalized_order.order_number, len(cart_items))
     return HttpResponse(f"Cart Placed As Order [{finalized_order.order_number}]")
 
 
 @api_view(["POST"])
+@idempotent
 def sync_cart(request):
-    """Syncs the Cart and all the cart related items. Assumes Cart exists for now"""
-    # Note: Similar to order/views.py
-    cart_obj = json.loads(request.body)
-    cart_id = cart_obj["cart_id"]
-    cart_items = cart_obj["items"]
+    """
+    Syncs the Cart and all the cart related items. Assumes Cart exists for now
+    Optionally takes the cart "version" the items were based on and returns 409 with the current cart if it is stale
+    """
+    # Note: Shares the diff engine in order/sync.py with order/views.py
+    try:
+        cart_obj = json.loads(request.body)
+        cart_id = cart_obj["cart_id"]
+        cart_items = cart_obj["items"]
+    except (KeyError, TypeError, ValueError):
+        return HttpResponse("Sync Must Be A JSON Object With cart_id And items", status=400)
+    expected_version = cart_obj.get("version")
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except (TypeError, ValueError):
+            return HttpResponse(f"Invalid Cart Version [{expected_version}]", status=400)
     try:
-        # Get the Cart and verify that it exists
-        cart = Cart.objects.get(cart_id=cart_id)
-    except ObjectDoesNotExist:
+        changes = get_cart_store().sync(cart_id, cart_items, expected_version)
+    except MenuItem.DoesNotExist as err:
+        return HttpResponse(str(err), status=404)
+    except Cart.DoesNotExist:
         return HttpResponse(f"Cart [{cart_id}] Not Found", status=404)
+    except VersionConflict:
+        return JsonResponse(get_cart_store().current(cart_id), status=409)
+    except CartBusy as err:
+        return cart_busy_response(err)
 
-    item_orders = CartItemOrder.objects.filter(cart=cart)
-    print("Items located for sync")
-    for cart_item in cart_items:
-        cart_item_item = cart_item["item"]
-        item_id = cart_item_item["item_id"]
-        try:
-            item_order = item_orders.all().get(item__item_id=int(item_id))
-        except ObjectDoesNotExist:
-            menuitem = MenuItem.objects.get(item_id=int(item_id))
-            item_order = CartItemOrder(cart=cart, item=menuitem, count=0)
-            print(f"New Cart Item Order Created For [{menuitem.name}]")
-
-        if item_order.count != cart_item["count"]:
-            print(f"Count Mismatch of {item_order.count} needing to sync to {cart_item['count']}")
-            item_order.count = cart_item["count"]
-            item_order.save()
-            # print(f"Cart Item Order Edited For [{item_order.item.name}]")
-            print(f"Cart Contents Changed [Cart {cart_id} <-- Item #{item_id} - [{item_order.item.name}] x{item_order.count}]")
-
-    # Remove items that are not in cart or have a count of 0
-    item_orders.all().filter(count__lte=0).delete()
-    item_orders.all().exclude(item__item_id__in=[cart_item["item"]["item_id"] for cart_item in cart_items]).delete()
+    if changes:
+        # One record per sync. changes maps item_id to (old count, new count)
+        logger.debug("Cart Contents Changed [Cart %s] %s", cart_id, changes, extra={"changes": changes})
 
     return HttpResponse("Cart Synced")
 
 
+@api_view(["POST"])
+def patch_cart(request):
+    """
+    Applies a small list of operations to a Cart instead of uploading the whole cart
+    Body: {"cart_id": ..., "version": ..., "ops": [{"op": "set" | "inc" | "remove", "item_id": ..., ...}]}
+    Responds with the new version, or 409 with the current cart if the version is stale
+    """
+    try:
+        patch_obj = json.loads(request.body)
+    except ValueError:
+        return HttpResponse("Patch Must Be A JSON Object", status=400)
+    if not isinstance(patch_obj, dict):
+        return HttpResponse("Patch Must Be A JSON Object", status=400)
+    cart_id = patch_obj.get("cart_id")
+    try:
+        version = int(patch_obj["version"])
+        ops = parse_ops(patch_obj.get("ops"))
+    except (KeyError, TypeError, ValueError):
+        return HttpResponse("Patch Must Include The Cart Version", status=400)
+    except PatchError as err:
+        return HttpResponse(str(err), status=400)
+
+    try:
+        new_version = get_cart_store().patch(cart_id, version, ops)
+    except Cart.DoesNotExist as err:
+        return HttpResponse(str(err), status=404)
+    except MenuItem.DoesNotExist as err:
+        return HttpResponse(str(err), status=404)
+    except VersionConflict:
+        return JsonResponse(get_cart_store().current(cart_id), status=409)
+    except CartBusy as err:
+        return cart_busy_response(err)
+
+    logger.debug("Cart Patched [Cart %s v%s -> v%s With %s Operation(s)]", cart_id, version, new_version, len(ops))
+    return JsonResponse({"cart_id": cart_id, "version": new_version})
+
+
 @api_view(["POST"])  # TODO: Swap with DELETE. May need to add CORs
 def empty_cart(request, cart_id):
-    print(f"Cart Emptied [{cart_id}]")
-    CartItemOrder.objects.filter(cart__cart_id=cart_id).delete()
+    logger.info("Cart Emptied [%s]", cart_id)
+    get_cart_store().empty(cart_id)
     # Deleting the cart itself is technically unnecessary
     # TODO: Test if the models.RESTRICT is working by uncommenting
     # Cart.objects.get(cart_id=cart_id).delete()
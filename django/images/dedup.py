@@ -0,0 +1,43 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+
+from .models import Image
+
+# Bytes hashed at a time when reading a stored or uploaded file
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(file):
+    """SHA-256 hex digest of a Django File (upload or stored file), read in chunks and rewound afterwards"""
+    content_hash = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        content_hash.update(chunk)
+    file.seek(0)
+    return content_hash.hexdigest()
+
+
+def find_by_hash(content_hash):
+    return Image.objects.filter(content_hash=content_hash).first()
+
+
+def save_unique(image):
+    """
+    Saves a new Image unless another upload stored the same content_hash first
+    Relies on the unique content_hash index, so concurrent uploads of the same file still end up as one Image
+    :param image: Unsaved Image with content_hash set. If its file is already stored and turns out to be a
+                  duplicate, the file is deleted
+    :return: (Image that owns the content, True if image was saved or False if an existing Image was returned)
+    """
+    try:
+        with transaction.atomic():
+            image.save()
+        return image, True
+    except IntegrityError:
+        existing = find_by_hash(image.content_hash)
+        if existing is None:
+            raise
+        # The file was written before the insert failed. Only the existing Image's copy is kept
+        if image.location.name and image.location.name != existing.location.name:
+            image.location.storage.delete(image.location.name)
+        return existing, False
@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import StoredObject
+from .s3 import S3_KEY_PREFIX, boto_client, object_key, storage_name
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_REFRESHED_KEY = "images:inventory:refreshed"
+INVENTORY_LOCK_KEY = "images:inventory:lock"
+# A refresh holding the lock longer than this is assumed to have died with its worker
+INVENTORY_LOCK_TIMEOUT = 60 * 15
+# Seconds to wait before retrying after a failed refresh, so an S3 outage is not hit on every request
+INVENTORY_RETRY_SECONDS = 60
+INVENTORY_PAGE_SIZE = 100
+INVENTORY_MAX_PAGE_SIZE = 1000
+
+# Single-flight within this process. The cache lock covers the other workers
+_refresh_lock = threading.Lock()
+
+
+def refresh_inventory(client=None, bucket=None):
+    """
+    Copies the full bucket listing into StoredObject, one list_objects_v2 page (up to 1000 keys) at a time
+    Objects missing from the listing are removed only after every page was read, so a failed refresh loses nothing
+    :param client: boto3 S3 client or a stand-in providing get_paginator("list_objects_v2"). Defaults to the app's
+    :param bucket: Bucket to list. Defaults to AWS_STORAGE_BUCKET_NAME
+    :return: Number of objects listed
+    """
+    client = client or boto_client
+    bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+    started = timezone.now()
+    listed = 0
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=S3_KEY_PREFIX):
+        # Pages of an empty bucket or prefix have no Contents
+        objects = [
+            StoredObject(key=s3_object["Key"], size=s3_object["Size"], etag=s3_object["ETag"].strip('"'),
+                         last_modified=s3_object["LastModified"], refreshed_at=started)
+            for s3_object in page.get("Contents", [])
+        ]
+        if objects:
+            StoredObject.objects.bulk_create(
+                objects, update_conflicts=True, unique_fields=["key"],
+                update_fields=["size", "etag", "last_modified", "refreshed_at"]
+            )
+        listed += len(objects)
+
+    StoredObject.objects.filter(refreshed_at__lt=started).delete()
+    cache.set(INVENTORY_REFRESHED_KEY, started.timestamp(), timeout=None)
+    return listed
+
+
+def refresh_in_background(client=None):
+    """Starts refresh_inventory on a daemon thread unless a refresh is already running. Returns True if started"""
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    if not cache.add(INVENTORY_LOCK_KEY, True, timeout=INVENTORY_LOCK_TIMEOUT):
+        _refresh_lock.release()
+        return False
+
+    def run():
+        try:
+            listed = refresh_inventory(client)
+            cache.delete(INVENTORY_LOCK_KEY)
+            logger.info("Image Inventory Refreshed [%s objects]", listed)
+        except Exception:
+            # Keeping the lock for a while doubles as the retry delay
+            cache.set(INVENTORY_LOCK_KEY, True, timeout=INVENTORY_RETRY_SECONDS)
+            logger.exception("Image Inventory Refresh Failed")
+        finally:
+            _refresh_lock.release()
+            # The thread's connection is not closed by any request, so close it instead of leaking it
+            connection.close()
+
+    threading.Thread(target=run, name="image-inventory", daemon=True).start()
+    return True
+
+
+def ensure_fresh(client=None):
+    """
+    Starts a background refresh when the inventory is older than IMAGE_INVENTORY_TTL_SECONDS
+    :return: Time of the last completed refresh in epoch seconds, or None if the inventory was never filled
+    """
+    refreshed = cache.get(INVENTORY_REFRESHED_KEY)
+    if refreshed is None or time.time() - refreshed > settings.IMAGE_INVENTORY_TTL_SECONDS:
+        refresh_in_background(client)
+    return refreshed
+
+
+def list_inventory(prefix="", cursor=None, limit=INVENTORY_PAGE_SIZE):
+    """
+    Lists storage names from the inventory in key order
+    :param prefix: Only list names starting with this
+    :param cursor: Only list names after this one (The next_cursor of the previous page)
+    :return: (List of storage names, next_cursor or None on the last page)
+    """
+    stored_objects = StoredObject.objects.filter(key__startswith=object_key(prefix)).order_by("key")
+    if cursor:
+        stored_objects = stored_objects.filter(key__gt=object_key(cursor))
+    # Fetch one extra key to know whether another page exists without a separate COUNT query
+    keys = list(stored_objects.values_list("key", flat=True)[:limit + 1])
+    names = [storage_name(key) for key in keys[:limit]]
+    return names, (names[-1] if len(keys) > limit else None)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from images.dedup import hash_file
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = "Computes content hashes for images stored before hashing was added and reports duplicate images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Images loaded per query")
+
+    def handle(self, *args, batch_size, **options):
+        # Hashes already in use, mapped to the image_id that owns them
+        owners = dict(Image.objects.filter(content_hash__isnull=False).values_list("content_hash", "image_id"))
+        hashed = missing = 0
+        duplicates = []
+
+        last_id = 0
+        while True:
+            batch = list(
+                Image.objects.filter(content_hash__isnull=True, image_id__gt=last_id).order_by("image_id")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].image_id
+            for image in batch:
+                try:
+                    with image.location.open("rb") as stored_file:
+                        content_hash = hash_file(stored_file)
+                except (FileNotFoundError, OSError) as err:
+                    missing += 1
+                    self.stderr.write(f"Image #{image.image_id} [{image.location.name}] Could Not Be Read: {err}")
+                    continue
+
+                # The hash index is unique, so duplicates keep a null hash and are only reported
+                if content_hash in owners:
+                    duplicates.append((image, owners[content_hash]))
+                    continue
+                Image.objects.filter(image_id=image.image_id).update(content_hash=content_hash)
+                owners[content_hash] = image.image_id
+                hashed += 1
+
+        for image, owner_id in duplicates:
+            self.stdout.write(f"Image #{image.image_id} [{image.location.name}] Duplicates Image #{owner_id}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Hashed {hashed} Images. {len(duplicates)} Duplicates Found. {missing} Files Could Not Be Read"
+        ))
@@ -0,0 +1,17 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from images.inventory import refresh_inventory
+
+
+class Command(BaseCommand):
+    help = "Refreshes the local copy of the S3 bucket listing used by images/list/full (e.g. on deploy or from cron)"
+
+    def handle(self, *args, **options):
+        if not settings.S3_ENABLED:
+            raise CommandError("Storage in S3 is disabled")
+        start = time.perf_counter()
+        listed = refresh_inventory()
+        self.stdout.write(self.style.SUCCESS(f"Listed {listed} Objects In {time.perf_counter() - start:.2f}s"))
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredObject',
+            fields=[
+                ('key', models.CharField(max_length=1024, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('etag', models.CharField(max_length=100)),
+                ('last_modified', models.DateTimeField()),
+                ('refreshed_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
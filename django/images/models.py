@@ -10,7 +10,33 @@ def generate_filepath(instance, filename):
 
 
 class Image(models.Model):
+    VARIANTS_PENDING = "pending"
+    VARIANTS_READY = "ready"
+    VARIANTS_FAILED = "failed"
+    VARIANTS_STATUS_CHOICES = [
+        (VARIANTS_PENDING, "Pending"),
+        (VARIANTS_READY, "Ready"),
+        (VARIANTS_FAILED, "Failed"),
+    ]
+
     image_id = models.AutoField(primary_key=True)
     timestamp = models.TimeField(auto_now_add=True)
     image_name = models.CharField(max_length=100, null=False)
     location = models.FileField(upload_to=generate_filepath)
+    # SHA-256 of the stored file. Uploads of content that is already stored reuse the existing Image
+    # Null for images uploaded before hashing until backfill_image_hashes is run
+    content_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    # Resized copies generated in the background by images/variants.py
+    # List of {"name": storage name, "width": ..., "height": ..., "format": "webp" | "jpeg"}
+    variants = models.JSONField(default=list, blank=True)
+    variants_status = models.CharField(max_length=10, choices=VARIANTS_STATUS_CHOICES, default=VARIANTS_PENDING)
+
+
+class StoredObject(models.Model):
+    """Local copy of the bucket listing, kept up to date by images/inventory.py so listing never waits on S3"""
+    key = models.CharField(max_length=1024, primary_key=True)
+    size = models.BigIntegerField()
+    etag = models.CharField(max_length=100)
+    last_modified = models.DateTimeField()
+    # Start time of the refresh that last saw the object. Rows not seen by the latest refresh were deleted in S3
+    refreshed_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,136 @@
+import hashlib
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from .dedup import HASH_CHUNK_SIZE
+from .s3 import boto_client, object_key
+
+# Seconds a browser has to start an upload with a presigned URL
+UPLOAD_URL_EXPIRES_SECONDS = 60 * 15
+# Seconds an upload token can be confirmed for. Covers slow uploads that started just before the URL expired
+UPLOAD_TOKEN_MAX_AGE = 60 * 60 * 24
+UPLOAD_TOKEN_SALT = "images.presign"
+UPLOAD_METHODS = ("POST", "PUT")
+# Seconds a confirm may hold an upload before another confirm can claim it (e.g. after its worker died)
+CONFIRM_PENDING_SECONDS = 60
+CONFIRM_PENDING = "pending"
+
+
+class UploadNotFound(Exception):
+    """Raised when a confirmed upload does not exist in the bucket"""
+
+
+def upload_parameters(content_type):
+    """put_object parameters every presigned upload is signed with, matching uploads that go through the storage"""
+    parameters = {"ContentType": content_type, **settings.AWS_S3_OBJECT_PARAMETERS}
+    if settings.AWS_DEFAULT_ACL:
+        parameters["ACL"] = settings.AWS_DEFAULT_ACL
+    return parameters
+
+
+def presign_post(name, content_type, client=None):
+    """
+    Presigns a browser form upload (POST) of a single file to the given storage name
+    The signed policy also limits the file size to IMAGE_UPLOAD_MAX_BYTES
+    :return: {"method": "POST", "url": ..., "fields": Form fields to send before the file field}
+    """
+    # Form field names of the put_object parameters
+    field_names = {"ContentType": "Content-Type", "CacheControl": "Cache-Control", "ACL": "acl"}
+    fields = {field_names[parameter]: value for parameter, value in upload_parameters(content_type).items()}
+    conditions = [{field: value} for field, value in fields.items()]
+    conditions.append(["content-length-range", 1, settings.IMAGE_UPLOAD_MAX_BYTES])
+    presigned = (client or boto_client).generate_presigned_post(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=object_key(name),
+        Fields=fields, Conditions=conditions, ExpiresIn=UPLOAD_URL_EXPIRES_SECONDS
+    )
+    return {"method": "POST", **presigned}
+
+
+def presign_put(name, content_type, client=None):
+    """
+    Presigns a raw body upload (PUT) to the given storage name
+    S3 cannot limit the size of a PUT, so confirming the upload checks it instead
+    :return: {"method": "PUT", "url": ..., "headers": Headers the request must send since they are signed}
+    """
+    header_names = {"ContentType": "Content-Type", "CacheControl": "Cache-Control", "ACL": "x-amz-acl"}
+    parameters = upload_parameters(content_type)
+    url = (client or boto_client).generate_presigned_url(
+        "put_object",
+        Params={"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": object_key(name), **parameters},
+        ExpiresIn=UPLOAD_URL_EXPIRES_SECONDS
+    )
+    return {
+        "method": "PUT",
+        "url": url,
+        "headers": {header_names[parameter]: value for parameter, value in parameters.items()}
+    }
+
+
+def head_upload(name, client=None):
+    """
+    :return: head_object response of the uploaded file (ContentLength, ContentType, ETag, ...)
+    :raises UploadNotFound: If nothing was uploaded to the name
+    """
+    try:
+        return (client or boto_client).head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=object_key(name))
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            raise UploadNotFound(f"Upload [{name}] Not Found")
+        raise
+
+
+def hash_upload(name, client=None):
+    """SHA-256 hex digest of an uploaded file, read from the bucket in chunks. Same as dedup.hash_file()"""
+    content_hash = hashlib.sha256()
+    body = (client or boto_client).get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=object_key(name))["Body"]
+    for chunk in body.iter_chunks(HASH_CHUNK_SIZE):
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def delete_upload(name, client=None):
+    (client or boto_client).delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=object_key(name))
+
+
+def make_upload_token(name, image_name):
+    """Signs the storage name an upload was presigned for, so it can only be confirmed as that Image"""
+    return signing.dumps({"name": name, "image_name": image_name}, salt=UPLOAD_TOKEN_SALT)
+
+
+def read_upload_token(token):
+    """
+    :return: {"name": ..., "image_name": ...}
+    :raises signing.BadSignature: If the token was tampered with or is older than UPLOAD_TOKEN_MAX_AGE
+    """
+    return signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=UPLOAD_TOKEN_MAX_AGE)
+
+
+def _confirm_key(name):
+    return f"upload-confirm:{name}"
+
+
+def claim_upload(name):
+    """
+    Claims an upload for confirming. Atomic in the cache, so only one of several concurrent confirms gets True
+    Needs a cache shared by every worker (REDIS_URL) to hold across workers
+    """
+    return cache.add(_confirm_key(name), CONFIRM_PENDING, timeout=CONFIRM_PENDING_SECONDS)
+
+
+def finish_upload(name, image_id):
+    """Records the Image an upload was confirmed as, for as long as its token can be confirmed"""
+    cache.set(_confirm_key(name), image_id, timeout=UPLOAD_TOKEN_MAX_AGE)
+
+
+def release_upload(name):
+    """Frees the claim of a confirm that failed, so the upload can be confirmed again"""
+    cache.delete(_confirm_key(name))
+
+
+def confirmed_image_id(name):
+    """Id of the Image an upload was confirmed as. None if it was not confirmed or is still being confirmed"""
+    image_id = cache.get(_confirm_key(name))
+    return None if image_id == CONFIRM_PENDING else image_id
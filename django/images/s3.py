@@ -0,0 +1,30 @@
+from django.conf import settings
+import boto3
+from botocore.config import Config
+
+# Client for direct S3 calls that django-storages does not cover (listing, multipart and presigned uploads)
+boto_client = None
+# Objects written through django-storages' endpoint land under a '<bucket>/' key prefix
+S3_KEY_PREFIX = ""
+
+if settings.S3_ENABLED:
+    session = boto3.session.Session()
+    boto_client = session.client("s3",
+                                 config=Config(s3={'addressing_style': 'virtual'}),
+                                 # Configures to use subdomain/virtual calling format.
+                                 region_name=settings.AWS_S3_REGION_NAME,
+                                 endpoint_url=settings.AWS_S3_REGION_ENDPOINT_URL,
+                                 aws_access_key_id=settings.AWS_S3_ACCESS_KEY_ID,
+                                 aws_secret_access_key=settings.AWS_S3_SECRET_ACCESS_KEY
+                                 )
+    S3_KEY_PREFIX = f"{settings.AWS_STORAGE_BUCKET_NAME}/"
+
+
+def object_key(name):
+    """S3 key of a file stored under the given storage name (e.g. Image.location.name)"""
+    return f"{S3_KEY_PREFIX}{name}"
+
+
+def storage_name(key):
+    """Storage name of the file at the given S3 key"""
+    return key[len(S3_KEY_PREFIX):] if key.startswith(S3_KEY_PREFIX) else key
@@ -3,7 +3,40 @@ from rest_framework import serializers
 from .models import Image
 
 
+def variant_srcset(storage, variants):
+    """Resized variants ordered by width. Empty until the background variant generation finishes"""
+    return [
+        {
+            "url": storage.url(variant["name"]),
+            "width": variant["width"],
+            "height": variant["height"],
+            "format": variant["format"],
+        }
+        for variant in sorted(variants, key=lambda variant: (variant["format"], variant["width"]))
+    ]
+
+
 class ImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ["image_id", "timestamp", "location"]
+        fields = ["image_id", "timestamp", "location", "srcset"]
+
+    def get_srcset(self, image):
+        return variant_srcset(image.location.storage, image.variants)
+
+
+def image_dicts(queryset):
+    """Same output as ImageSerializer(queryset, many=True).data, as plain dicts built from one .values_list() query"""
+    storage = Image._meta.get_field("location").storage
+    return [
+        {
+            "image_id": image_id,
+            "timestamp": timestamp.isoformat() if timestamp is not None else None,
+            "location": storage.url(location) if location else None,
+            "srcset": variant_srcset(storage, variants),
+        }
+        for image_id, timestamp, location, variants
+        in queryset.values_list("image_id", "timestamp", "location", "variants")
+    ]
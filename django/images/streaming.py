@@ -0,0 +1,111 @@
+import hashlib
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .s3 import boto_client, object_key
+
+# Bytes read from the request body at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+# Bytes buffered per S3 multipart part. S3 requires at least 5 MiB for every part but the last
+S3_PART_SIZE = 8 * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when a streamed upload goes over IMAGE_UPLOAD_MAX_BYTES"""
+
+
+class LocalStreamWriter:
+    """Writes a stream to a temporary file next to its final path under MEDIA_ROOT, then renames it into place"""
+
+    def __init__(self, name, content_type):
+        self.path = default_storage.path(name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.partial_path = f"{self.path}.part"
+        self.file = open(self.partial_path, "wb")
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+class S3MultipartWriter:
+    """Uploads a stream to S3 as a multipart upload, holding at most one part in memory"""
+
+    def __init__(self, name, content_type, client=None):
+        self.client = client or boto_client
+        self.bucket = settings.AWS_STORAGE_BUCKET_NAME
+        self.key = object_key(name)
+        extra_args = {"ContentType": content_type, **settings.AWS_S3_OBJECT_PARAMETERS}
+        if settings.AWS_DEFAULT_ACL:
+            extra_args["ACL"] = settings.AWS_DEFAULT_ACL
+        self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **extra_args)["UploadId"]
+        self.parts = []
+        self.buffer = bytearray()
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=bytes(self.buffer)
+        )
+        self.parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self.buffer.clear()
+
+    def write(self, chunk):
+        self.buffer.extend(chunk)
+        if len(self.buffer) >= S3_PART_SIZE:
+            self._upload_part()
+
+    def commit(self):
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+def stream_to_storage(stream, name, content_type=None, max_bytes=None):
+    """
+    Copies a file-like stream to media storage chunk by chunk, so memory use does not depend on the file size
+    Writes to S3 with a multipart upload when S3_ENABLED and to MEDIA_ROOT otherwise
+    :param stream: File-like object to read from (e.g. the request)
+    :param name: Storage name to write to. Should come from Storage.get_available_name()
+    :param content_type: MIME type stored with S3 objects. Guessed from the name if None
+    :param max_bytes: Upload size limit. Defaults to IMAGE_UPLOAD_MAX_BYTES
+    :return: (size in bytes, SHA-256 hex digest of the content)
+    :raises UploadTooLarge: If the stream goes over max_bytes. Nothing is left in storage in this case
+    """
+    max_bytes = max_bytes or settings.IMAGE_UPLOAD_MAX_BYTES
+    content_type = content_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+    writer = (S3MultipartWriter if settings.S3_ENABLED else LocalStreamWriter)(name, content_type)
+
+    content_hash = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Upload Exceeds {max_bytes} Bytes")
+            content_hash.update(chunk)
+            writer.write(chunk)
+        writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    return size, content_hash.hexdigest()
@@ -0,0 +1,66 @@
+import hashlib
+import io
+from unittest.mock import patch
+
+import boto3
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .models import Image
+from .presign import claim_upload, make_upload_token
+
+
+class UploadImageStreamTests(TestCase):
+    def test_malformed_content_length_is_rejected(self):
+        response = self.client.post("/images/upload/stream?fileName=Cake&originalName=cake.png", b"image",
+                                    content_type="image/png", CONTENT_LENGTH="five")
+        self.assertEqual(response.status_code, 400)
+
+
+# Own cache, so clearing it leaves the shared file cache of a development checkout alone
+@override_settings(S3_ENABLED=True, AWS_STORAGE_BUCKET_NAME="bucket",
+                   CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ConfirmUploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_s3 = boto3.client("s3", region_name="us-east-1", aws_access_key_id="key",
+                                      aws_secret_access_key="secret")
+        self.stubber = Stubber(self.client_s3)
+        self.stubber.activate()
+        for patcher in (patch("images.presign.boto_client", self.client_s3), patch("images.views.schedule_variants")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stub_upload(self, name, content):
+        params = {"Bucket": "bucket", "Key": name}
+        self.stubber.add_response("head_object", {"ContentLength": len(content)}, params)
+        self.stubber.add_response("get_object", {"Body": StreamingBody(io.BytesIO(content), len(content))}, params)
+
+    def confirm(self, name):
+        token = make_upload_token(name, "Cake")
+        return self.client.post("/images/upload/confirm", {"token": token}, content_type="application/json")
+
+    def test_confirming_twice_returns_the_same_image(self):
+        self.stub_upload("images/cake.png", b"cake")
+        first = self.confirm("images/cake.png").json()
+        # Nothing else is stubbed, so a second look at the bucket would fail
+        self.assertEqual(self.confirm("images/cake.png").json()["image_id"], first["image_id"])
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_confirming_a_copy_of_a_stored_image_returns_it(self):
+        existing = Image.objects.create(image_name="Cake", location="images/cake.png",
+                                        content_hash=hashlib.sha256(b"cake").hexdigest())
+        self.stub_upload("images/cake-copy.png", b"cake")
+        with patch.object(Image.location.field.storage, "delete") as delete:
+            response = self.confirm("images/cake-copy.png")
+        self.assertEqual(response.json()["image_id"], existing.image_id)
+        delete.assert_called_once_with("images/cake-copy.png")
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_upload_being_confirmed_is_not_confirmed_again(self):
+        claim_upload("images/cake.png")
+        response = self.confirm("images/cake.png")
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Image.objects.exists())
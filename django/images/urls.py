@@ -4,6 +4,9 @@ from . import views
 
 urlpatterns = [
     path('upload', views.upload_image),
+    path('upload/stream', views.upload_image_stream),
+    path('upload/presign', views.presign_upload),
+    path('upload/confirm', views.confirm_upload),
     path('list/full', views.list_all_images),
     path('list', views.list_images)
 ]
@@ -0,0 +1,81 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image as PILImage, ImageOps
+
+from .models import Image
+
+logger = logging.getLogger(__name__)
+
+# File extension and Pillow save options for each variant format
+VARIANT_FORMATS = {
+    "webp": ("webp", {"quality": 80, "method": 4}),
+    "jpeg": ("jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Shared by every upload in this process so resizing never runs on a request thread
+_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix="image-variants")
+
+
+def schedule_variants(image_id):
+    """Queues variant generation for an Image once the transaction saving it commits"""
+    transaction.on_commit(lambda: _executor.submit(generate_variants, image_id))
+
+
+def variant_widths(original_width):
+    """Configured widths narrower than the original. Images narrower than all of them get one variant at full width"""
+    widths = sorted(width for width in settings.IMAGE_VARIANT_WIDTHS if width < original_width)
+    return widths or [original_width]
+
+
+def encode_variant(picture, variant_format):
+    extension, save_options = VARIANT_FORMATS[variant_format]
+    if variant_format == "jpeg" and picture.mode != "RGB":
+        # JPEG has no alpha channel. Flatten transparent images onto white
+        background = PILImage.new("RGB", picture.size, (255, 255, 255))
+        background.paste(picture, mask=picture.getchannel("A") if "A" in picture.getbands() else None)
+        picture = background
+    buffer = BytesIO()
+    picture.save(buffer, format=variant_format.upper(), **save_options)
+    return extension, buffer.getvalue()
+
+
+def generate_variants(image_id):
+    """
+    Decodes the original of an Image once and stores a resized copy per configured width and format
+    Runs on the variant worker pool. Records the variants (or the failure) on Image.variants_status
+    """
+    try:
+        image = Image.objects.get(image_id=image_id)
+        storage = image.location.storage
+        with image.location.open("rb") as original:
+            picture = PILImage.open(original)
+            picture.load()
+        # Apply camera rotation before resizing since EXIF metadata is not copied to the variants
+        picture = ImageOps.exif_transpose(picture)
+        if picture.mode not in ("RGB", "RGBA"):
+            picture = picture.convert("RGBA" if "transparency" in picture.info else "RGB")
+
+        stem = PurePosixPath(image.location.name).stem
+        variants = []
+        for width in variant_widths(picture.width):
+            height = max(1, round(picture.height * width / picture.width))
+            resized = picture if width == picture.width else picture.resize((width, height), PILImage.LANCZOS)
+            for variant_format in settings.IMAGE_VARIANT_FORMATS:
+                extension, content = encode_variant(resized, variant_format)
+                name = storage.save(f"variants/{image_id}/{stem}-{width}w.{extension}", ContentFile(content))
+                variants.append({"name": name, "width": width, "height": height, "format": variant_format})
+
+        Image.objects.filter(image_id=image_id).update(variants=variants, variants_status=Image.VARIANTS_READY)
+        logger.info("Image Variants Generated [Image #%s x%s]", image_id, len(variants))
+    except Exception:
+        Image.objects.filter(image_id=image_id).update(variants_status=Image.VARIANTS_FAILED)
+        logger.exception("Image Variant Generation Failed [Image #%s]", image_id)
+    finally:
+        # Worker threads outlive requests, so close the thread's connection instead of leaking it
+        connection.close()
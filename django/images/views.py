@@ -1,52 +1,211 @@
+import logging
+import os
+
 from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
 from django.http import HttpResponse, JsonResponse
 from rest_framework.decorators import api_view
-import boto3
-from botocore.config import Config
 
-from .models import Image
-from .serializers import ImageSerializer
+from OrderUp.instrumentation import timed
+from OrderUp.rendering import json_response
+from .dedup import find_by_hash, hash_file, save_unique
+from .inventory import INVENTORY_MAX_PAGE_SIZE, INVENTORY_PAGE_SIZE, ensure_fresh, list_inventory
+from .models import Image, generate_filepath
+from .presign import (UPLOAD_METHODS, UploadNotFound, claim_upload, confirmed_image_id, delete_upload, finish_upload,
+                      hash_upload, head_upload, make_upload_token, presign_post, presign_put, read_upload_token,
+                      release_upload)
+from .serializers import image_dicts
+from .streaming import UploadTooLarge, stream_to_storage
+from .variants import schedule_variants
 
-if settings.S3_ENABLED:
-    session = boto3.session.Session()
-    boto_client = session.client("s3",
-                                 config=Config(s3={'addressing_style': 'virtual'}),
-                                 # Configures to use subdomain/virtual calling format.
-                                 region_name=settings.AWS_S3_REGION_NAME,
-                                 endpoint_url=settings.AWS_S3_REGION_ENDPOINT_URL,
-                                 aws_access_key_id=settings.AWS_S3_ACCESS_KEY_ID,
-                                 aws_secret_access_key=settings.AWS_S3_SECRET_ACCESS_KEY
-                                 )
+logger = logging.getLogger(__name__)
 
 
 @api_view(["POST"])
 def upload_image(request):
-    """Saves a new Image"""
-    new_image = Image(location=request.data["fileUpload"], image_name=request.data["fileName"])
-    new_image.save()
+    """
+    Saves a new Image. Resized variants are generated in the background after the original is stored
+    Files whose content is already stored are not written again
+    """
+    upload = request.data["fileUpload"]
+    content_hash = hash_file(upload)
+    existing = find_by_hash(content_hash)
+    if existing is not None:
+        return HttpResponse(f"Image Already Uploaded [Image #{existing.image_id}]")
+
+    image, created = save_unique(Image(location=upload, image_name=request.data["fileName"], content_hash=content_hash))
+    if not created:
+        return HttpResponse(f"Image Already Uploaded [Image #{image.image_id}]")
+    schedule_variants(image.image_id)
     return HttpResponse("Image Uploaded")
 
 
+@api_view(["POST", "PUT"])
+def upload_image_stream(request):
+    """
+    Saves a new Image from the raw request body, streamed to storage in chunks instead of buffered as a form
+    Query parameters:
+        fileName - Name of the image (Same as the fileName form field of upload_image)
+        originalName - Name of the uploaded file. Only its extension is used
+    The content hash is only known once the body is stored, so a duplicate is removed again and the existing Image
+    is returned with "duplicate": true
+    """
+    image_name = request.query_params.get("fileName")
+    original_name = request.query_params.get("originalName", "")
+    if not image_name or "." not in original_name:
+        return HttpResponse("fileName and originalName (With An Extension) Are Required", status=400)
+
+    # Reject oversized uploads up front when the client declares the size
+    max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return HttpResponse(f"Invalid Content-Length [{request.META['CONTENT_LENGTH']}]", status=400)
+    if content_length > max_bytes:
+        return HttpResponse(f"Upload Exceeds {max_bytes} Bytes", status=413)
+    if request.stream is None:
+        return HttpResponse("Upload Body Is Empty Or Missing Its Content-Length", status=411)
+
+    new_image = Image(image_name=image_name)
+    name = default_storage.get_available_name(generate_filepath(new_image, original_name), max_length=100)
+    try:
+        size, content_hash = stream_to_storage(request.stream, name, request.content_type or None, max_bytes)
+    except UploadTooLarge as err:
+        return HttpResponse(str(err), status=413)
+
+    # Assigning the name (rather than a File) records the already stored file without uploading it again
+    new_image.location = name
+    new_image.content_hash = content_hash
+    image, created = save_unique(new_image)
+    if created:
+        schedule_variants(image.image_id)
+        logger.info("Image Streamed To Storage [Image #%s - %s - %s bytes]", image.image_id, name, size)
+    return JsonResponse({"image_id": image.image_id, "size": size, "sha256": content_hash, "duplicate": not created})
+
+
+@api_view(["POST"])
+def presign_upload(request):
+    """
+    Presigns an upload straight from the browser to the S3 bucket, so the file never passes through a worker
+    Body:
+        fileName - Name of the image
+        originalName - Name of the file to upload. Only its extension is used
+        contentType - MIME type of the file. Must be an image type
+        method - "POST" for a form upload (Default) or "PUT" for a raw body upload
+    Returns the URL to upload to and a token for upload/confirm, which creates the Image once the upload finished
+    """
+    if not settings.S3_ENABLED:
+        return HttpResponse("Storage In S3 Is Disabled", status=501)
+
+    image_name = request.data.get("fileName")
+    original_name = request.data.get("originalName", "")
+    content_type = request.data.get("contentType", "")
+    method = request.data.get("method", "POST")
+    if not image_name or "." not in original_name:
+        return HttpResponse("fileName and originalName (With An Extension) Are Required", status=400)
+    if not content_type.startswith("image/"):
+        return HttpResponse(f"Invalid Image Content Type [{content_type}]", status=400)
+    if method not in UPLOAD_METHODS:
+        return HttpResponse(f"Upload Method Must Be One Of {list(UPLOAD_METHODS)}", status=400)
+
+    # Always suffixed, so the presigned upload cannot overwrite a file stored under the same name
+    file_root, file_extension = os.path.splitext(generate_filepath(Image(image_name=image_name), original_name))
+    name = default_storage.get_alternative_name(file_root, file_extension)
+    upload = presign_post(name, content_type) if method == "POST" else presign_put(name, content_type)
+    return JsonResponse({**upload, "token": make_upload_token(name, image_name)})
+
+
+@api_view(["POST"])
+def confirm_upload(request):
+    """
+    Creates the Image for a finished presigned upload
+    Body: token - Token returned by upload/presign
+    Confirming the same upload again returns the same Image. Files whose content is already stored are removed again
+    and the existing Image is returned
+    """
+    if not settings.S3_ENABLED:
+        return HttpResponse("Storage In S3 Is Disabled", status=501)
+    try:
+        upload = read_upload_token(request.data.get("token", ""))
+    except signing.BadSignature:
+        return HttpResponse("Invalid Or Expired Upload Token", status=400)
+
+    name = upload["name"]
+    image = Image.objects.filter(location=name).first()
+    if image is None and not claim_upload(name):
+        # Another confirm of this upload finished or is still running
+        image = Image.objects.filter(image_id=confirmed_image_id(name)).first()
+        if image is None:
+            response = HttpResponse(f"Upload [{name}] Is Still Being Confirmed", status=409)
+            response["Retry-After"] = "1"
+            return response
+    if image is None:
+        try:
+            head = head_upload(name)
+        except UploadNotFound as err:
+            release_upload(name)
+            return HttpResponse(str(err), status=404)
+        except BaseException:
+            release_upload(name)
+            raise
+        max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+        if head["ContentLength"] > max_bytes:
+            delete_upload(name)
+            release_upload(name)
+            return HttpResponse(f"Upload Exceeds {max_bytes} Bytes", status=413)
+
+        try:
+            image, created = save_unique(
+                Image(image_name=upload["image_name"], location=name, content_hash=hash_upload(name))
+            )
+        except BaseException:
+            release_upload(name)
+            raise
+        finish_upload(name, image.image_id)
+        if created:
+            schedule_variants(image.image_id)
+            logger.info("Presigned Upload Confirmed [Image #%s - %s - %s bytes]", image.image_id, name,
+                        head["ContentLength"])
+    return JsonResponse({"image_id": image.image_id, "location": image.location.url})
+
+
 @api_view(["GET"])
 def list_all_images(request):
+    """
+    Lists every file in the S3 bucket from a local inventory that is refreshed in the background (images/inventory.py)
+    Optional query parameters:
+        prefix - Only list names starting with this
+        cursor - next_cursor of the previous page
+        limit - Maximum number of names to return (Default 100)
+    """
     if not settings.S3_ENABLED:
         return JsonResponse({
             "error": "Storage in S3 is disabled",
             "images": []
         })
 
-    response = boto_client.list_objects(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+    try:
+        limit = int(request.GET.get("limit", INVENTORY_PAGE_SIZE))
+    except ValueError:
+        return HttpResponse("Invalid Pagination Parameters", status=400)
+    if not 0 < limit <= INVENTORY_MAX_PAGE_SIZE:
+        return HttpResponse(f"Limit Must Be Between 1 and {INVENTORY_MAX_PAGE_SIZE}", status=400)
 
-    all_s3_images = [key["Key"] for key in response['Contents']]
-    all_s3_images_no_prefix = [s3_image[len(settings.AWS_STORAGE_BUCKET_NAME) + 1:] for s3_image in all_s3_images]
+    refreshed = ensure_fresh()
+    names, next_cursor = list_inventory(request.GET.get("prefix", ""), request.GET.get("cursor"), limit)
     return JsonResponse({
-        "images": all_s3_images_no_prefix
+        "images": names,
+        "next_cursor": next_cursor,
+        # Null until the first refresh completes
+        "refreshed_at": refreshed
     })
 
 
 @api_view(["GET"])
 def list_images(request):
-    all_images = Image.objects.all()
-    return JsonResponse({
-        "images": ImageSerializer(all_images, many=True).data
+    with timed("serialize"):
+        serialized_images = image_dicts(Image.objects.all())
+    return json_response({
+        "images": serialized_images
     })
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MenuConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'menu'
+
+    def ready(self):
+        # Connects the menu cache invalidation signals
+        from . import signals  # noqa: F401
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+from OrderUp.instrumentation import timed
+from OrderUp.rendering import get_json_encoder
+from .models import MenuItem
+from .serializers import menu_item_dicts
+
+MENU_VERSION_KEY = "menu:version"
+# Cached payloads are replaced by a version bump long before this, the timeout only frees abandoned versions
+MENU_PAYLOAD_TIMEOUT = 60 * 60 * 24
+
+
+def get_menu_version():
+    """Returns the current menu version, starting a new version sequence if the cache lost it"""
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        # Seeded from the clock so a restarted sequence never reuses a version cached before it was lost
+        cache.add(MENU_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(MENU_VERSION_KEY)
+    return version
+
+
+def bump_menu_version():
+    """Invalidates every cached menu payload. Called after any MenuItem write commits (see menu/signals.py)"""
+    try:
+        cache.incr(MENU_VERSION_KEY)
+    except ValueError:
+        # Version was never set or was evicted. Starting a new sequence invalidates just the same
+        get_menu_version()
+
+
+def build_menu_payload():
+    """Queries and serializes the whole menu. Returns (etag, JSON bytes) encoded with JSON_ENCODER"""
+    with timed("serialize"):
+        body = get_json_encoder()({
+            "items": menu_item_dicts(MenuItem.objects.all())
+        })
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"', body
+
+
+def get_menu_payload():
+    """
+    Returns (etag, JSON bytes) for the current menu version, building and caching it on a miss
+    Note: Writes that skip model signals (e.g. QuerySet.update()) must call bump_menu_version() themselves
+    """
+    payload_key = f"menu:payload:{get_menu_version()}"
+    payload = cache.get(payload_key)
+    if payload is None:
+        payload = build_menu_payload()
+        cache.set(payload_key, payload, timeout=MENU_PAYLOAD_TIMEOUT)
+    return payload
+
+
+# (menu version, serialized menu items by item_id) parsed from the cached payload by this process
+_menu_items = (None, {})
+
+
+def get_menu_items():
+    """Serialized menu items by item_id for the current menu version. The payload is parsed once per version"""
+    global _menu_items
+    version = get_menu_version()
+    if _menu_items[0] != version:
+        etag, body = get_menu_payload()
+        _menu_items = (version, {item["item_id"]: item for item in json.loads(body)["items"]})
+    return _menu_items[1]
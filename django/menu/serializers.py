@@ -6,3 +6,12 @@ class MenuItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = MenuItem
         fields = ["item_id", "name", "description"]
+
+
+# Fast equivalent of MenuItemSerializer for .values() rows. Every field is a plain column
+MENU_ITEM_FIELDS = tuple(MenuItemSerializer.Meta.fields)
+
+
+def menu_item_dicts(queryset):
+    """Same output as MenuItemSerializer(queryset, many=True).data, as plain dicts built from one .values() query"""
+    return list(queryset.values(*MENU_ITEM_FIELDS))
@@ -1,10 +1,11 @@
 import json
 
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
 from rest_framework.decorators import api_view
 
+from .cache import get_menu_payload
 from .models import MenuItem
-from .serializers import MenuItemSerializer
 
 
 @api_view(["POST"])
@@ -21,7 +22,18 @@ def add_menuitem(request):
 
 @api_view(["GET"])
 def list_menuitem(request):
-    all_menuitems = MenuItem.objects.all()
-    return JsonResponse({
-        "items": MenuItemSerializer(all_menuitems, many=True).data
-    })
+    """Lists all menu items from the versioned menu cache. Answers a matching If-None-Match with 304"""
+    etag, body = get_menu_payload()
+
+    # Weak comparison, since CompressionMiddleware weakens the ETag of compressed menus
+    if_none_match = [
+        tag[2:] if tag.startswith("W/") else tag for tag in parse_etags(request.headers.get("If-None-Match", ""))
+    ]
+    if etag in if_none_match or "*" in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # Browsers may keep the menu but must revalidate it with the ETag on every use
+    response["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,90 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from .models import ArchivedOrder, ItemOrder, Order
+
+logger = logging.getLogger(__name__)
+
+# Orders moved per transaction. Keeps each transaction (and its row locks) short while the kitchen is working
+ARCHIVE_BATCH_SIZE = 500
+
+
+def archivable_orders(cutoff):
+    """
+    Fulfilled orders fulfilled before the cutoff. Orders fulfilled before fulfilled_at existed go by placed_at
+    Orders whose order number is already archived are left live (see conflicting_orders())
+    """
+    return Order.objects.filter(
+        Q(fulfilled_at__lt=cutoff) | Q(fulfilled_at__isnull=True, placed_at__lt=cutoff),
+        fulfilled=True,
+    ).exclude(order_number__in=ArchivedOrder.objects.values("order_number"))
+
+
+def conflicting_orders(cutoff):
+    """
+    Order numbers of orders that are due for archiving but already have an archived order with the same number, e.g.
+    after order numbers were reused by loading fixtures or resetting the sequence. Both are real orders, so they need
+    sorting out by hand
+    """
+    return list(
+        Order.objects.filter(
+            Q(fulfilled_at__lt=cutoff) | Q(fulfilled_at__isnull=True, placed_at__lt=cutoff),
+            fulfilled=True, order_number__in=ArchivedOrder.objects.values("order_number"),
+        ).order_by("order_number").values_list("order_number", flat=True)
+    )
+
+
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Moves one batch of archivable orders into ArchivedOrder in a single transaction with a fixed number of queries
+    :return: Number of orders archived. 0 once nothing is left to archive
+    """
+    with transaction.atomic():
+        # Locked so an order being unfulfilled concurrently is either archived first or left alone
+        order_numbers = list(
+            archivable_orders(cutoff).select_for_update().order_by("order_number")
+            .values_list("order_number", flat=True)[:batch_size]
+        )
+        if not order_numbers:
+            return 0
+
+        orders = Order.objects.filter(order_number__in=order_numbers).prefetch_related(
+            Prefetch("items", queryset=ItemOrder.objects.select_related("item"))
+        )
+        # Raises IntegrityError (rolling the batch back) if an order number was archived since it was selected
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                order_number=order.order_number,
+                placed_at=order.placed_at,
+                fulfilled_at=order.fulfilled_at,
+                items=[
+                    {"item_id": item_order.item_id, "name": item_order.item.name, "count": item_order.count}
+                    for item_order in order.items.all()
+                ]
+            )
+            for order in orders
+        ])
+        ItemOrder.objects.filter(order_id__in=order_numbers).delete()
+        Order.objects.filter(order_number__in=order_numbers).delete()
+    return len(order_numbers)
+
+
+def archive_orders(older_than, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archives every order fulfilled longer ago than older_than, one batch at a time
+    :param older_than: timedelta since fulfillment
+    :return: Number of orders archived
+    """
+    cutoff = timezone.now() - older_than
+    conflicts = conflicting_orders(cutoff)
+    if conflicts:
+        logger.error("Orders Not Archived, Order Numbers Already Archived %s", conflicts)
+    archived = 0
+    while True:
+        batch_count = archive_batch(cutoff, batch_size)
+        if not batch_count:
+            return archived
+        archived += batch_count
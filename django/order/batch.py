@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .events import ORDER_DELETED, ORDER_FULFILLED, publish_order_events
+from .models import Order
+from .stats import record_deleted_orders
+
+# Fulfillment status each update action sets
+BATCH_UPDATES = {"fulfill": True, "unfulfill": False}
+BATCH_ACTIONS = (*BATCH_UPDATES, "delete")
+# Upper bound for the number of orders in a single batch
+BATCH_MAX_ORDERS = 500
+
+RESULT_OK = "ok"
+RESULT_NOT_FOUND = "not_found"
+RESULT_DUPLICATE = "duplicate"
+
+
+class BatchError(Exception):
+    """Raised for malformed batches. The message is safe to return to the client"""
+
+
+def parse_batch(raw_actions):
+    """
+    Validates the actions of a batch
+    :param raw_actions: List of {"order_number": ..., "action": "fulfill" | "unfulfill" | "delete"} dictionaries
+    :return: List of (order_number, action) tuples in the posted order
+    :raises BatchError: If an action is malformed
+    """
+    if not isinstance(raw_actions, list) or not raw_actions:
+        raise BatchError("Batch Must Contain A List Of Actions")
+    if len(raw_actions) > BATCH_MAX_ORDERS:
+        raise BatchError(f"Batch Cannot Contain More Than {BATCH_MAX_ORDERS} Orders")
+
+    actions = []
+    for raw_action in raw_actions:
+        try:
+            order_number = int(raw_action["order_number"])
+            action = raw_action["action"]
+        except (KeyError, TypeError, ValueError):
+            raise BatchError(f"Malformed Batch Action {raw_action}")
+        if action not in BATCH_ACTIONS:
+            raise BatchError(f"Unknown Batch Action [{action}]")
+        actions.append((order_number, action))
+    return actions
+
+
+def apply_batch(actions):
+    """
+    Applies parsed actions in one transaction with one update() or delete() per action type,
+    so the number of queries does not depend on the number of orders
+    Only the first action for an order is applied. Later ones are reported as duplicates
+    :return: List of {"order_number": ..., "action": ..., "result": "ok" | "not_found" | "duplicate"} in posted order
+    """
+    first_actions = {}
+    for order_number, action in actions:
+        first_actions.setdefault(order_number, action)
+
+    with transaction.atomic():
+        found = set(Order.objects.filter(order_number__in=first_actions).values_list("order_number", flat=True))
+        numbers_by_action = {action: [] for action in BATCH_ACTIONS}
+        for order_number, action in first_actions.items():
+            if order_number in found:
+                numbers_by_action[action].append(order_number)
+
+        for action, fulfilled in BATCH_UPDATES.items():
+            if numbers_by_action[action]:
+                Order.objects.filter(order_number__in=numbers_by_action[action]).update(
+                    fulfilled=fulfilled, fulfilled_at=timezone.now() if fulfilled else None
+                )
+                publish_order_events(ORDER_FULFILLED, [
+                    {"order_number": order_number, "fulfilled": fulfilled}
+                    for order_number in numbers_by_action[action]
+                ])
+        if numbers_by_action["delete"]:
+            record_deleted_orders(numbers_by_action["delete"])
+            Order.objects.filter(order_number__in=numbers_by_action["delete"]).delete()
+            publish_order_events(ORDER_DELETED, [
+                {"order_number": order_number} for order_number in numbers_by_action["delete"]
+            ])
+
+    results = []
+    seen = set()
+    for order_number, action in actions:
+        if order_number in seen:
+            result = RESULT_DUPLICATE
+        else:
+            result = RESULT_OK if order_number in found else RESULT_NOT_FOUND
+            seen.add(order_number)
+        results.append({"order_number": order_number, "action": action, "result": result})
+    return results
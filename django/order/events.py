@@ -0,0 +1,262 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Min
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Event types pushed to the live order feed
+ORDER_CREATED = "order.created"
+ORDER_SYNCED = "order.synced"
+ORDER_FULFILLED = "order.fulfilled"
+ORDER_DELETED = "order.deleted"
+# Sent instead of a backlog when a client resumes from an event that is no longer retained
+FEED_RESET = "feed.reset"
+
+
+# Events read per query by DatabaseBroker
+EVENT_FETCH_LIMIT = 500
+# DatabaseBroker trims the stored history once every this many events
+EVENT_TRIM_INTERVAL = 100
+
+
+class OrderEvent:
+    def __init__(self, event_id, event_type, data, timestamp=None):
+        self.event_id = event_id
+        self.event_type = event_type
+        self.data = data
+        self.timestamp = timestamp or time.time()
+
+
+class OrderEventBroker:
+    """
+    Interface for order event pub/sub backends. Set ORDER_EVENTS_BACKEND to swap implementations
+    publish() is called from synchronous views. listen() is consumed by the async feed in order/feed.py
+    """
+
+    def publish(self, event_type, data):
+        """Publishes an event to every listener and returns the published OrderEvent"""
+        raise NotImplementedError
+
+    def publish_many(self, event_type, data_list):
+        """Publishes one event per data dictionary, in order"""
+        for data in data_list:
+            self.publish(event_type, data)
+
+    async def listen(self, last_event_id=None):
+        """
+        Async generator of OrderEvents published after last_event_id (or after subscribing if None)
+        Yields a FEED_RESET event first if events after last_event_id are no longer available
+        """
+        raise NotImplementedError
+        yield
+
+
+class _Subscriber:
+    def __init__(self, loop, max_queued):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Runs on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client. End its stream so it reconnects and resumes from the retained history instead
+            self.overflowed = True
+
+
+class InProcessBroker(OrderEventBroker):
+    """
+    Keeps events and listeners in the memory of the current process
+    Only listeners connected to the same process receive events, so it only suits a single worker (e.g. runserver).
+    Multi-worker deployments need DatabaseBroker
+    """
+
+    def __init__(self, history_size=None, max_queued=None):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._history = deque(maxlen=history_size or getattr(settings, "ORDER_EVENTS_HISTORY", 1000))
+        self._max_queued = max_queued or getattr(settings, "ORDER_EVENTS_MAX_QUEUED", 1000)
+        self._subscribers = set()
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = OrderEvent(next(self._ids), event_type, data)
+            self._last_id = event.event_id
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # Event loop already closed. The listener's finally block will remove it
+                pass
+        return event
+
+    async def listen(self, last_event_id=None):
+        subscriber = _Subscriber(asyncio.get_running_loop(), self._max_queued)
+        with self._lock:
+            # Subscribe and snapshot the history together so no event falls in between
+            self._subscribers.add(subscriber)
+            backlog = list(self._history)
+            newest_id = self._last_id
+        try:
+            last_seen = last_event_id
+            if last_event_id is not None:
+                oldest_retained = backlog[0].event_id if backlog else newest_id + 1
+                if last_event_id > newest_id or last_event_id < oldest_retained - 1:
+                    # Events were dropped from the history or ids restarted with the process. Client must reload
+                    yield OrderEvent(newest_id, FEED_RESET, {"reason": "history_unavailable"})
+                    backlog = []
+                    last_seen = newest_id
+                for event in backlog:
+                    if event.event_id > last_event_id:
+                        last_seen = event.event_id
+                        yield event
+
+            while not subscriber.overflowed:
+                event = await subscriber.queue.get()
+                # Skip events already sent from the backlog
+                if last_seen is not None and event.event_id <= last_seen:
+                    continue
+                last_seen = event.event_id
+                yield event
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+class DatabaseBroker(OrderEventBroker):
+    """
+    Stores events in the OrderEventRecord table, so listeners on every worker and host receive every event, and event
+    ids (the table's ids) stay valid when a client resumes on another worker
+    Each process polls the table once every ORDER_EVENTS_POLL_SECONDS for all of its listeners, so events reach
+    clients with up to that much delay. Publishing costs one INSERT (publish_many() one for all events)
+    Ids are assigned on insert but become visible on commit, so an event committed after a newer one was polled is
+    skipped. Events are published after their transaction commits, which keeps that window to the INSERT itself
+    """
+
+    def __init__(self, history_size=None, max_queued=None, poll_seconds=None):
+        self._history_size = history_size or getattr(settings, "ORDER_EVENTS_HISTORY", 1000)
+        self._max_queued = max_queued or getattr(settings, "ORDER_EVENTS_MAX_QUEUED", 1000)
+        self._poll_seconds = poll_seconds or getattr(settings, "ORDER_EVENTS_POLL_SECONDS", 1.0)
+        self._subscribers = set()
+        self._poller = None
+        self._last_polled_id = 0
+
+    def publish(self, event_type, data):
+        from .models import OrderEventRecord
+        record = OrderEventRecord.objects.create(event_type=event_type, data=data)
+        if record.id % EVENT_TRIM_INTERVAL == 0:
+            OrderEventRecord.objects.filter(id__lte=record.id - self._history_size).delete()
+        return OrderEvent(record.id, event_type, data, record.created_at.timestamp())
+
+    def publish_many(self, event_type, data_list):
+        from .models import OrderEventRecord
+        records = OrderEventRecord.objects.bulk_create(
+            [OrderEventRecord(event_type=event_type, data=data) for data in data_list]
+        )
+        if records and records[0].id is not None:
+            if records[0].id // EVENT_TRIM_INTERVAL != records[-1].id // EVENT_TRIM_INTERVAL:
+                OrderEventRecord.objects.filter(id__lte=records[-1].id - self._history_size).delete()
+
+    @staticmethod
+    def _fetch(after_id):
+        """Up to EVENT_FETCH_LIMIT stored events with ids above after_id, oldest first"""
+        from .models import OrderEventRecord
+        # Runs outside of requests, where nothing else replaces connections that went stale
+        close_old_connections()
+        return [
+            OrderEvent(record.id, record.event_type, record.data, record.created_at.timestamp())
+            for record in OrderEventRecord.objects.filter(id__gt=after_id).order_by("id")[:EVENT_FETCH_LIMIT]
+        ]
+
+    @staticmethod
+    def _id_range():
+        """(Oldest, newest) stored event id. (None, 0) if nothing is stored"""
+        from .models import OrderEventRecord
+        close_old_connections()
+        ids = OrderEventRecord.objects.aggregate(oldest=Min("id"), newest=Max("id"))
+        return ids["oldest"], ids["newest"] or 0
+
+    async def _poll_forever(self):
+        """Delivers new events to this process's listeners until the last one leaves"""
+        try:
+            while self._subscribers:
+                await asyncio.sleep(self._poll_seconds)
+                try:
+                    events = await sync_to_async(self._fetch)(self._last_polled_id)
+                except Exception:
+                    logger.exception("Order Event Poll Failed")
+                    continue
+                for event in events:
+                    self._last_polled_id = event.event_id
+                    for subscriber in list(self._subscribers):
+                        subscriber.deliver(event)
+        finally:
+            self._poller = None
+
+    async def listen(self, last_event_id=None):
+        subscriber = _Subscriber(asyncio.get_running_loop(), self._max_queued)
+        # Subscribed before reading the stored ids, so events stored after that read are delivered by the poller
+        self._subscribers.add(subscriber)
+        try:
+            oldest_id, newest_id = await sync_to_async(self._id_range)()
+            if self._poller is None or self._poller.get_loop().is_closed():
+                self._last_polled_id = newest_id
+                self._poller = asyncio.ensure_future(self._poll_forever())
+
+            last_seen = newest_id
+            if last_event_id is not None:
+                if last_event_id > newest_id or last_event_id < (oldest_id or newest_id + 1) - 1:
+                    # Events were trimmed from the history or the id is from another database. Client must reload
+                    yield OrderEvent(newest_id, FEED_RESET, {"reason": "history_unavailable"})
+                else:
+                    last_seen = last_event_id
+                    while True:
+                        backlog = await sync_to_async(self._fetch)(last_seen)
+                        for event in backlog:
+                            last_seen = event.event_id
+                            yield event
+                        if len(backlog) < EVENT_FETCH_LIMIT:
+                            break
+
+            while not subscriber.overflowed:
+                event = await subscriber.queue.get()
+                # Skip events already sent from the backlog
+                if event.event_id <= last_seen:
+                    continue
+                last_seen = event.event_id
+                yield event
+        finally:
+            self._subscribers.discard(subscriber)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Returns the process-wide broker configured by ORDER_EVENTS_BACKEND"""
+    backend_path = getattr(settings, "ORDER_EVENTS_BACKEND", "order.events.DatabaseBroker")
+    return import_string(backend_path)()
+
+
+def publish_order_event(event_type, data):
+    """Publishes an order event once the current transaction commits (immediately outside of one)"""
+    transaction.on_commit(lambda: get_broker().publish(event_type, data))
+
+
+def publish_order_events(event_type, data_list):
+    """Same as publish_order_event() for several events, which the broker may publish together"""
+    if data_list:
+        transaction.on_commit(lambda: get_broker().publish_many(event_type, data_list))
@@ -0,0 +1,219 @@
+import csv
+import heapq
+import io
+from collections import defaultdict
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.db import connections
+from django.http import QueryDict
+
+from OrderUp.rendering import get_json_encoder
+from .models import ArchivedOrder, ItemOrder, Order
+from .params import parse_bool_param, parse_datetime_param
+
+# Path the export is mounted on in OrderUp/asgi.py. Served by views.export_order_stream under WSGI (e.g. runserver)
+ORDER_EXPORT_PATH = "/order/export"
+# Orders read per keyset query. Memory use depends on this, not on the number of orders exported
+EXPORT_CHUNK_SIZE = 500
+# Output is sent in pieces of about this many bytes
+EXPORT_BUFFER_BYTES = 64 * 1024
+EXPORT_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# One CSV row per line item. Orders without items get one row with empty item columns
+CSV_COLUMNS = ("order_number", "placed_at", "fulfilled", "fulfilled_at", "archived", "item_id", "name", "count")
+
+
+class ExportError(Exception):
+    """Raised for invalid export parameters. The message is safe to return to the client"""
+
+
+def parse_export_params(params):
+    """
+    Validates export query parameters
+    :param params: QueryDict (or dictionary) with the optional output ("ndjson" or "csv"), fulfilled,
+                   since and until (ISO datetimes compared with placed_at) and archived parameters
+    :return: Dictionary of export_orders() keyword arguments
+    :raises ExportError: If a parameter is invalid
+    """
+    # Not named format, which DRF reserves for picking a renderer
+    export_format = params.get("output", "ndjson")
+    if export_format not in EXPORT_CONTENT_TYPES:
+        raise ExportError(f"Output Must Be One Of {list(EXPORT_CONTENT_TYPES)}")
+    filters = {}
+    for name in ("fulfilled", "archived"):
+        if params.get(name) is not None:
+            filters[name] = parse_bool_param(params[name])
+            if filters[name] is None:
+                raise ExportError(f"Invalid {name} Filter [{params[name]}]")
+    try:
+        since = parse_datetime_param(params.get("since"))
+        until = parse_datetime_param(params.get("until"))
+    except ValueError:
+        raise ExportError("since and until Must Be ISO Datetimes")
+    return {
+        "export_format": export_format,
+        "fulfilled": filters.get("fulfilled"),
+        "since": since,
+        "until": until,
+        "include_archived": filters.get("archived", False),
+    }
+
+
+def _filter_placed_at(queryset, since, until):
+    if since is not None:
+        queryset = queryset.filter(placed_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(placed_at__lt=until)
+    return queryset
+
+
+def _keyset_chunks(queryset, fields, chunk_size):
+    """Yields lists of .values() rows in order_number order, one query per chunk"""
+    last_order_number = None
+    while True:
+        chunk_queryset = queryset if last_order_number is None else queryset.filter(order_number__gt=last_order_number)
+        chunk = list(chunk_queryset.order_by("order_number").values(*fields)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_order_number = chunk[-1]["order_number"]
+
+
+def live_orders(fulfilled=None, since=None, until=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields live orders with their items as export dictionaries in order_number order, two queries per chunk"""
+    orders = _filter_placed_at(Order.objects.all(), since, until)
+    if fulfilled is not None:
+        orders = orders.filter(fulfilled=fulfilled)
+    for chunk in _keyset_chunks(orders, ("order_number", "placed_at", "fulfilled", "fulfilled_at"), chunk_size):
+        items_by_order = defaultdict(list)
+        for order_id, item_id, name, count in ItemOrder.objects.filter(
+            order_id__in=[order["order_number"] for order in chunk]
+        ).order_by("id").values_list("order_id", "item_id", "item__name", "count"):
+            items_by_order[order_id].append({"item_id": item_id, "name": name, "count": count})
+        for order in chunk:
+            order["archived"] = False
+            order["items"] = items_by_order[order["order_number"]]
+            yield order
+
+
+def archived_orders(fulfilled=None, since=None, until=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields archived orders as export dictionaries in order_number order, one query per chunk"""
+    if fulfilled is False:
+        # Only fulfilled orders are archived
+        return
+    orders = _filter_placed_at(ArchivedOrder.objects.all(), since, until)
+    for chunk in _keyset_chunks(orders, ("order_number", "placed_at", "fulfilled_at", "items"), chunk_size):
+        for order in chunk:
+            yield {
+                "order_number": order["order_number"],
+                "placed_at": order["placed_at"],
+                "fulfilled": True,
+                "fulfilled_at": order["fulfilled_at"],
+                "archived": True,
+                "items": order["items"],
+            }
+
+
+def ndjson_lines(orders):
+    encode = get_json_encoder()
+    for order in orders:
+        yield encode(order) + b"\n"
+
+
+def csv_lines(orders):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take_rows():
+        rows = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return rows
+
+    writer.writerow(CSV_COLUMNS)
+    yield take_rows()
+    for order in orders:
+        order_columns = [
+            order["order_number"],
+            order["placed_at"].isoformat() if order["placed_at"] else "",
+            order["fulfilled"],
+            order["fulfilled_at"].isoformat() if order["fulfilled_at"] else "",
+            order["archived"],
+        ]
+        for item in order["items"] or [{"item_id": "", "name": "", "count": ""}]:
+            writer.writerow([*order_columns, item["item_id"], item["name"], item["count"]])
+        yield take_rows()
+
+
+def export_orders(export_format="ndjson", fulfilled=None, since=None, until=None, include_archived=False,
+                  chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams orders with their items in order_number order as NDJSON (one order per line) or CSV (one line item per
+    row), reading them with keyset queries of chunk_size orders so memory use stays flat however many are exported
+    :param fulfilled: Only export orders with this fulfillment status if not None
+    :param since: Only export orders placed at or after this datetime if not None
+    :param until: Only export orders placed before this datetime if not None
+    :param include_archived: Also export orders moved to ArchivedOrder by order/archive.py
+    :return: Iterator of bytes pieces of about EXPORT_BUFFER_BYTES
+    """
+    orders = live_orders(fulfilled, since, until, chunk_size)
+    if include_archived:
+        orders = heapq.merge(
+            archived_orders(fulfilled, since, until, chunk_size), orders, key=lambda order: order["order_number"]
+        )
+    lines = csv_lines(orders) if export_format == "csv" else ndjson_lines(orders)
+
+    pending = []
+    pending_bytes = 0
+    for line in lines:
+        pending.append(line)
+        pending_bytes += len(line)
+        if pending_bytes >= EXPORT_BUFFER_BYTES:
+            yield b"".join(pending)
+            pending = []
+            pending_bytes = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def export_filename(export_format):
+    return f"orders.{export_format}"
+
+
+async def order_export(scope, receive, send):
+    """
+    ASGI app streaming export_orders(). Django 4.1 iterates StreamingHttpResponse on the event loop under ASGI,
+    where the export's queries are not allowed, so each piece is produced in a worker thread instead
+    """
+    if scope["method"] != "GET":
+        await send({"type": "http.response.start", "status": 405, "headers": [(b"allow", b"GET")]})
+        await send({"type": "http.response.body", "body": b"Method Not Allowed"})
+        return
+    try:
+        params = parse_export_params(QueryDict(scope.get("query_string", b"")))
+    except ExportError as err:
+        await send({"type": "http.response.start", "status": 400, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": str(err).encode()})
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", EXPORT_CONTENT_TYPES[params["export_format"]].encode()),
+            (b"content-disposition", f'attachment; filename="{export_filename(params["export_format"])}"'.encode()),
+        ]
+    })
+    # Keeps every query of this export on one thread of its own, like a Django request
+    async with ThreadSensitiveContext():
+        pieces = export_orders(**params)
+        next_piece = sync_to_async(next, thread_sensitive=True)
+        try:
+            while True:
+                piece = await next_piece(pieces, None)
+                if piece is None:
+                    break
+                await send({"type": "http.response.body", "body": piece, "more_body": True})
+        finally:
+            await sync_to_async(pieces.close, thread_sensitive=True)()
+            await sync_to_async(connections.close_all, thread_sensitive=True)()
+    await send({"type": "http.response.body", "body": b""})
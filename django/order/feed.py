@@ -0,0 +1,92 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .events import get_broker
+
+# Path the live order feed is mounted on in OrderUp/asgi.py
+ORDER_FEED_PATH = "/order/feed"
+
+
+def format_event(event):
+    """Formats an OrderEvent as a Server-Sent Events message"""
+    data = json.dumps({"type": event.event_type, "timestamp": event.timestamp, **event.data}, cls=DjangoJSONEncoder)
+    return f"id: {event.event_id}\nevent: {event.event_type}\ndata: {data}\n\n".encode()
+
+
+def parse_last_event_id(scope):
+    """Reads the resume point from the Last-Event-ID header (sent by EventSource on reconnect) or ?last_event_id="""
+    raw_value = None
+    for header_name, header_value in scope["headers"]:
+        if header_name == b"last-event-id":
+            raw_value = header_value.decode("latin1")
+    if raw_value is None:
+        raw_value = parse_qs(scope.get("query_string", b"").decode("latin1")).get("last_event_id", [None])[0]
+    try:
+        return int(raw_value) if raw_value else None
+    except ValueError:
+        return None
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def order_feed(scope, receive, send):
+    """
+    ASGI app streaming order events as Server-Sent Events
+    Pushes order.created, order.synced, order.fulfilled and order.deleted events as they are published
+    Clients resume with the Last-Event-ID header or the last_event_id query parameter
+    """
+    if scope["method"] != "GET":
+        await send({"type": "http.response.start", "status": 405, "headers": [(b"allow", b"GET")]})
+        await send({"type": "http.response.body", "body": b"Method Not Allowed"})
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            # Stop reverse proxies from buffering the stream
+            (b"x-accel-buffering", b"no"),
+        ]
+    })
+    # Tell EventSource how long to wait before reconnecting
+    await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+    heartbeat_interval = getattr(settings, "ORDER_FEED_HEARTBEAT_SECONDS", 15)
+    events = get_broker().listen(parse_last_event_id(scope))
+    next_event = asyncio.ensure_future(events.__anext__())
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {next_event, disconnect}, timeout=heartbeat_interval, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                return
+            if next_event in done:
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    # The broker ended the stream (e.g. the client fell behind). The client reconnects and resumes
+                    break
+                await send({"type": "http.response.body", "body": format_event(event), "more_body": True})
+                next_event = asyncio.ensure_future(events.__anext__())
+            else:
+                # Comment line keeping idle connections open through proxies
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        next_event.cancel()
+        disconnect.cancel()
+        await asyncio.gather(next_event, disconnect, return_exceptions=True)
+        await events.aclose()
@@ -0,0 +1,21 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from order.archive import ARCHIVE_BATCH_SIZE, archive_orders
+
+
+class Command(BaseCommand):
+    help = "Moves fulfilled orders out of the live order tables into ArchivedOrder (e.g. nightly from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-hours", type=float, default=settings.ORDER_ARCHIVE_AFTER_HOURS,
+                            help="Only archive orders fulfilled at least this many hours ago")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Orders moved per transaction")
+
+    def handle(self, *args, older_than_hours, batch_size, **options):
+        start = time.perf_counter()
+        archived = archive_orders(timedelta(hours=older_than_hours), batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} Orders In {time.perf_counter() - start:.2f}s"))
@@ -0,0 +1,44 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order.export import EXPORT_CONTENT_TYPES, ExportError, export_orders, parse_export_params
+
+
+class Command(BaseCommand):
+    help = "Streams orders with their items as NDJSON or CSV (e.g. for end-of-day reconciliation)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=list(EXPORT_CONTENT_TYPES), default="ndjson",
+                            help="ndjson (one order per line) or csv (one line item per row)")
+        parser.add_argument("--fulfilled", help="Only export fulfilled (true) or open (false) orders")
+        parser.add_argument("--since", help="ISO datetime. Only export orders placed at or after this")
+        parser.add_argument("--until", help="ISO datetime. Only export orders placed before this")
+        parser.add_argument("--archived", action="store_true", help="Also export archived orders")
+        parser.add_argument("--output", help="File to write to. Defaults to stdout")
+
+    def handle(self, *args, output, **options):
+        params = {name: options[name] for name in ("fulfilled", "since", "until") if options[name]}
+        params["output"] = options["format"]
+        if options["archived"]:
+            params["archived"] = "true"
+        try:
+            export_params = parse_export_params(params)
+        except ExportError as err:
+            raise CommandError(str(err))
+
+        start = time.perf_counter()
+        exported_bytes = 0
+        output_file = open(output, "wb") if output else sys.stdout.buffer
+        try:
+            for piece in export_orders(**export_params):
+                output_file.write(piece)
+                exported_bytes += len(piece)
+        finally:
+            if output:
+                output_file.close()
+            else:
+                output_file.flush()
+        # Reported on stderr so stdout only holds the export
+        self.stderr.write(self.style.SUCCESS(f"Exported {exported_bytes} Bytes In {time.perf_counter() - start:.2f}s"))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.stats import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the hourly and daily sales rollups behind /order/stats from live and archived orders. "
+            "Run it while no orders are being placed")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        item_rows, order_rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {item_rows} Item Rollups And {order_rows} Order Rollups In {time.perf_counter() - start:.2f}s"
+        ))
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:08
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_itemorders(apps, schema_editor):
+    """Folds duplicate (order, item) rows into the oldest row with their counts summed before the unique constraint"""
+    ItemOrder = apps.get_model('order', 'ItemOrder')
+    duplicates = (
+        ItemOrder.objects
+        .values('order_id', 'item_id')
+        .annotate(row_count=Count('id'), total=Sum('count'), keep_id=Min('id'))
+        .filter(row_count__gt=1)
+    )
+    for duplicate in duplicates:
+        ItemOrder.objects.filter(id=duplicate['keep_id']).update(count=duplicate['total'])
+        ItemOrder.objects.filter(
+            order_id=duplicate['order_id'], item_id=duplicate['item_id']
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_itemorders, migrations.RunPython.noop),
+    ]
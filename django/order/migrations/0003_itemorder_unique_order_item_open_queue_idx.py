@@ -0,0 +1,21 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0002_merge_duplicate_itemorders'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('fulfilled', False)), fields=['order_number'], name='order_open_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemorder',
+            constraint=models.UniqueConstraint(fields=('order', 'item'), name='unique_order_item'),
+        ),
+    ]
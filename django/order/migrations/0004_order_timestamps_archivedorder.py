@@ -0,0 +1,34 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_itemorder_unique_order_item_open_queue_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('order_number', models.IntegerField(primary_key=True, serialize=False)),
+                ('placed_at', models.DateTimeField()),
+                ('fulfilled_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('items', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='fulfilled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='placed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
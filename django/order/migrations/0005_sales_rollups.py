@@ -0,0 +1,40 @@
+# Generated by Django 4.1.4 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_timestamps_archivedorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('item_id', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('orders', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ordervolume',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket'), name='unique_order_volume_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemsales',
+            constraint=models.UniqueConstraint(fields=('period', 'bucket', 'item_id'), name='unique_item_sales_bucket'),
+        ),
+    ]
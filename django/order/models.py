@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from menu.models import MenuItem
 
@@ -6,8 +7,17 @@ from menu.models import MenuItem
 class Order(models.Model):
     order_number = models.AutoField(primary_key=True)
     fulfilled = models.BooleanField(null=False, blank=False, default=False)
+    placed_at = models.DateTimeField(default=timezone.now)
+    # Null while unfulfilled. Fulfilled orders are moved to ArchivedOrder some time after this (see order/archive.py)
+    fulfilled_at = models.DateTimeField(null=True, blank=True)
     # Use Order.items to access all ItemOrder instances
 
+    class Meta:
+        indexes = [
+            # Partial index covering the open queue kitchen screens page through (fulfilled=false by order_number)
+            models.Index(fields=["order_number"], condition=models.Q(fulfilled=False), name="order_open_queue_idx"),
+        ]
+
 
 class ItemOrderTemplate(models.Model):
     item = models.ForeignKey(MenuItem, models.RESTRICT, null=False, blank=False)
@@ -19,3 +29,60 @@ class ItemOrderTemplate(models.Model):
 
 class ItemOrder(ItemOrderTemplate):
     order = models.ForeignKey(Order, models.CASCADE, null=False, blank=False, related_name="items")
+
+    class Meta(ItemOrderTemplate.Meta):
+        constraints = [
+            # Each menu item appears once per order. Also the index behind (order, item) lookups and upserts
+            models.UniqueConstraint(fields=["order", "item"], name="unique_order_item"),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    Fulfilled Order moved out of the live tables by the archive_orders command. Never changed after archiving
+    Line items are stored as a snapshot so archived orders do not hold on to MenuItems through models.RESTRICT
+    """
+    order_number = models.IntegerField(primary_key=True)
+    placed_at = models.DateTimeField()
+    fulfilled_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    # List of {"item_id": ..., "name": ..., "count": ...} as they were when the order was archived
+    items = models.JSONField(default=list)
+
+
+class ItemSales(models.Model):
+    """Units of a menu item ordered per hour or day. Kept up to date by order/stats.py as orders change"""
+    period = models.CharField(max_length=4)  # "hour" or "day"
+    bucket = models.DateTimeField()  # Start of the hour or day the orders were placed in
+    # Plain integer instead of a ForeignKey, so rollups neither join MenuItem nor stop menu items from being deleted
+    item_id = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Target of the incremental upserts. Also the index behind reading a period's buckets in order
+            models.UniqueConstraint(fields=["period", "bucket", "item_id"], name="unique_item_sales_bucket"),
+        ]
+
+
+class OrderVolume(models.Model):
+    """Number of orders placed per hour or day. Kept up to date by order/stats.py as orders are placed or deleted"""
+    period = models.CharField(max_length=4)
+    bucket = models.DateTimeField()
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["period", "bucket"], name="unique_order_volume_bucket"),
+        ]
+
+
+class OrderEventRecord(models.Model):
+    """
+    Order event published through order.events.DatabaseBroker. The auto id is the event id sent to feed clients, so
+    it is the same on every worker. Only the newest ORDER_EVENTS_HISTORY events are kept for clients resuming
+    """
+    id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=32)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
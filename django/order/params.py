@@ -0,0 +1,26 @@
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def parse_bool_param(value):
+    """Parses a boolean query parameter. Returns None if the value is not a recognized boolean"""
+    value = value.strip().lower()
+    if value in ("true", "1", "yes"):
+        return True
+    if value in ("false", "0", "no"):
+        return False
+    return None
+
+
+def parse_datetime_param(value):
+    """
+    Parses an ISO datetime query parameter. Naive datetimes are in TIME_ZONE
+    :return: Aware datetime, or None if the parameter is missing
+    :raises ValueError: If the value is not an ISO datetime
+    """
+    if value is None:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid Datetime [{value}]")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
@@ -1,6 +1,6 @@
 from rest_framework import serializers
-from menu.serializers import MenuItemSerializer
-from .models import Order, ItemOrder
+from menu.serializers import MENU_ITEM_FIELDS, MenuItemSerializer
+from .models import ArchivedOrder, Order, ItemOrder
 
 
 class ItemOrderSerializer(serializers.ModelSerializer):
@@ -17,3 +17,38 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ["order_number", "fulfilled", "items"]
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrder
+        fields = ["order_number", "placed_at", "fulfilled_at", "items"]
+
+
+# Columns read by item_order_dicts. Menu item fields are joined in the same query
+ITEM_ORDER_VALUES = ("count", *(f"item__{field}" for field in MENU_ITEM_FIELDS))
+
+
+def item_order_dicts(queryset, parent_field):
+    """
+    Same output as ItemOrderSerializer (or CartItemSerializer) per row, as plain dicts built from one
+    .values_list() query in id order
+    :param parent_field: Column returned along with each item (e.g. "order_id" or "cart_id") to group items by
+    :return: List of (parent id, {"item": {...}, "count": ...}) tuples
+    """
+    return [
+        (parent_id, {"item": dict(zip(MENU_ITEM_FIELDS, item_values)), "count": count})
+        for parent_id, count, *item_values in queryset.order_by("id").values_list(parent_field, *ITEM_ORDER_VALUES)
+    ]
+
+
+def order_dicts(queryset):
+    """
+    Same output as OrderSerializer(queryset, many=True).data with two queries, one for the orders and one for
+    their items, without instantiating models or serializers
+    """
+    orders = list(queryset.values(*(field for field in OrderSerializer.Meta.fields if field != "items")))
+    items_by_order = {order["order_number"]: order.setdefault("items", []) for order in orders}
+    for order_id, item_order in item_order_dicts(ItemOrder.objects.filter(order_id__in=items_by_order), "order_id"):
+        items_by_order[order_id].append(item_order)
+    return orders
@@ -0,0 +1,163 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ItemOrder, ItemSales, Order, OrderVolume
+
+logger = logging.getLogger(__name__)
+
+STATS_PERIODS = ("hour", "day")
+# Rollup rows written per INSERT when rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+
+def bucket_start(moment, period):
+    """Start of the hour or day (in TIME_ZONE) that a datetime falls in"""
+    moment = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+    if period == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def bucket_step(period):
+    return timedelta(hours=1) if period == "hour" else timedelta(days=1)
+
+
+def _add_to_rollups(model, key_columns, value_column, deltas):
+    """Adds deltas to rollup rows in one statement, inserting the rows that do not exist yet"""
+    if not deltas:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ", ".join(f'"{column}"' for column in (*key_columns, value_column))
+    keys = ", ".join(f'"{column}"' for column in key_columns)
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * (len(key_columns) + 1)) + ")"] * len(deltas))
+    params = []
+    for (period, bucket, *rest), delta in deltas.items():
+        params.extend([period, connection.ops.adapt_datetimefield_value(bucket), *rest, delta])
+    with connection.cursor() as cursor:
+        # Supported as-is by both SQLite (3.24+) and PostgreSQL
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+            f'ON CONFLICT ({keys}) DO UPDATE SET "{value_column}" = {table}."{value_column}" + excluded."{value_column}"',
+            params
+        )
+
+
+def record_sales(line_items=(), orders=(), sign=1):
+    """
+    Adds orders to the hourly and daily rollups with at most two statements. Call it inside the transaction that
+    changes the orders, so the rollups commit (or roll back) together with them
+    :param line_items: Iterable of (placed_at, item_id, count change) tuples
+    :param orders: Iterable of placed_at of orders that were placed
+    :param sign: -1 to remove the line items and orders instead (e.g. for deleted orders that were never fulfilled)
+    """
+    item_deltas = defaultdict(int)
+    for placed_at, item_id, count in line_items:
+        for period in STATS_PERIODS:
+            item_deltas[(period, bucket_start(placed_at, period), item_id)] += sign * count
+    order_deltas = defaultdict(int)
+    for placed_at in orders:
+        for period in STATS_PERIODS:
+            order_deltas[(period, bucket_start(placed_at, period))] += sign
+
+    _add_to_rollups(ItemSales, ("period", "bucket", "item_id"), "count",
+                    {key: delta for key, delta in item_deltas.items() if delta})
+    _add_to_rollups(OrderVolume, ("period", "bucket"), "orders", order_deltas)
+
+
+def record_deleted_orders(order_numbers):
+    """
+    Keeps the rollups right for orders that are about to be deleted, with at most six queries
+    Fulfilled orders were sold, so they stay in the rollups and are moved to ArchivedOrder (and so /order/history),
+    where rebuild_rollups() still counts them. Orders never fulfilled (e.g. cancelled) are removed from the rollups
+    A fulfilled order whose order number is already archived cannot be moved. It is logged as an error and removed
+    from the rollups like a cancelled order, so the rollups still match rebuild_rollups()
+    """
+    orders = Order.objects.filter(order_number__in=order_numbers).values_list(
+        "order_number", "placed_at", "fulfilled", "fulfilled_at"
+    )
+    items_by_order = defaultdict(list)
+    for order_id, item_id, name, count in ItemOrder.objects.filter(order_id__in=order_numbers).order_by("id") \
+            .values_list("order_id", "item_id", "item__name", "count"):
+        items_by_order[order_id].append({"item_id": item_id, "name": name, "count": count})
+
+    cancelled = []
+    served = []
+    for order_number, placed_at, fulfilled, fulfilled_at in orders:
+        if fulfilled:
+            served.append(ArchivedOrder(order_number=order_number, placed_at=placed_at, fulfilled_at=fulfilled_at,
+                                        items=items_by_order[order_number]))
+        else:
+            cancelled.append((order_number, placed_at))
+    if served:
+        archived_numbers = set(ArchivedOrder.objects.filter(
+            order_number__in=[order.order_number for order in served]
+        ).values_list("order_number", flat=True))
+        if archived_numbers:
+            logger.error("Deleted Orders Not Archived, Order Numbers Already Archived %s", sorted(archived_numbers))
+            cancelled.extend((order.order_number, order.placed_at)
+                             for order in served if order.order_number in archived_numbers)
+        ArchivedOrder.objects.bulk_create([order for order in served if order.order_number not in archived_numbers])
+    record_sales(
+        [(placed_at, item["item_id"], item["count"])
+         for order_number, placed_at in cancelled for item in items_by_order[order_number]],
+        [placed_at for _, placed_at in cancelled],
+        sign=-1
+    )
+
+
+def rebuild_rollups():
+    """
+    Recomputes every rollup from the live and archived orders in one transaction (e.g. after a backfill)
+    Deleted orders that were fulfilled are counted through their ArchivedOrder copy (see record_deleted_orders())
+    Orders placed while rebuilding may be counted twice or not at all, so run it while the shop is closed
+    :return: (Number of ItemSales rows, number of OrderVolume rows)
+    """
+    item_counts = defaultdict(int)
+    order_counts = defaultdict(int)
+
+    def add_order(placed_at, items):
+        for period in STATS_PERIODS:
+            bucket = bucket_start(placed_at, period)
+            order_counts[(period, bucket)] += 1
+            for item_id, count in items:
+                item_counts[(period, bucket, item_id)] += count
+
+    with transaction.atomic():
+        for placed_at, items in ArchivedOrder.objects.values_list("placed_at", "items").iterator():
+            add_order(placed_at, [(item["item_id"], item["count"]) for item in items])
+        items_by_order = defaultdict(list)
+        for order_id, item_id, count in ItemOrder.objects.values_list("order_id", "item_id", "count").iterator():
+            items_by_order[order_id].append((item_id, count))
+        for order_number, placed_at in Order.objects.values_list("order_number", "placed_at").iterator():
+            add_order(placed_at, items_by_order.get(order_number, []))
+
+        ItemSales.objects.all().delete()
+        OrderVolume.objects.all().delete()
+        ItemSales.objects.bulk_create([
+            ItemSales(period=period, bucket=bucket, item_id=item_id, count=count)
+            for (period, bucket, item_id), count in item_counts.items()
+        ], batch_size=REBUILD_BATCH_SIZE)
+        OrderVolume.objects.bulk_create([
+            OrderVolume(period=period, bucket=bucket, orders=orders)
+            for (period, bucket), orders in order_counts.items()
+        ], batch_size=REBUILD_BATCH_SIZE)
+    return len(item_counts), len(order_counts)
+
+
+def read_stats(period, since, until):
+    """
+    Reads the rollups of the buckets starting in [since, until) with two queries, whatever the number of orders
+    :return: List of {"bucket": ..., "orders": ..., "items": {item_id: count}} in bucket order, without empty buckets
+    """
+    buckets = {}
+    for bucket, orders in OrderVolume.objects.filter(period=period, bucket__gte=since, bucket__lt=until) \
+            .order_by("bucket").values_list("bucket", "orders"):
+        buckets[bucket] = {"bucket": bucket, "orders": orders, "items": {}}
+    for bucket, item_id, count in ItemSales.objects.filter(period=period, bucket__gte=since, bucket__lt=until) \
+            .exclude(count=0).values_list("bucket", "item_id", "count"):
+        buckets.setdefault(bucket, {"bucket": bucket, "orders": 0, "items": {}})["items"][item_id] = count
+    return sorted(buckets.values(), key=lambda entry: entry["bucket"])
@@ -0,0 +1,76 @@
+from django.db import transaction
+
+from menu.models import MenuItem
+
+
+def posted_counts(posted_items):
+    """
+    :param posted_items: List of {"item": {"item_id": ...}, "count": ...} dictionaries from the frontend
+    :return: Dictionary of item_id to wanted count. Later entries for the same item win
+    """
+    wanted_counts = {}
+    for posted_item in posted_items:
+        wanted_counts[int(posted_item["item"]["item_id"])] = int(posted_item["count"])
+    return wanted_counts
+
+
+def diff_counts(current_counts, wanted_counts):
+    """
+    Compares stored item counts with the wanted ones. Items with a wanted count of 0 or less, and items missing
+    from wanted_counts, are to be removed
+    :return: Dictionary of changed item_ids mapped to their (old count, new count). Removed items have a new count of 0
+    """
+    changes = {}
+    for item_id, count in wanted_counts.items():
+        if count > 0 and item_id not in current_counts:
+            changes[item_id] = (0, count)
+    for item_id, current_count in current_counts.items():
+        wanted_count = max(wanted_counts.get(item_id, 0), 0)
+        if wanted_count != current_count:
+            changes[item_id] = (current_count, wanted_count)
+    return changes
+
+
+def sync_item_orders(model, parent_field, parent, posted_items):
+    """
+    Overwrites the item orders of a Cart or Order with the posted items in a fixed number of queries
+    Current rows are loaded once and diffed in memory, then applied with one upsert and one delete
+    Relies on the unique (parent, item) constraint so rows inserted concurrently are updated instead of duplicated
+    Items with a count of 0 or less and items missing from posted_items are removed
+    :param model: ItemOrderTemplate subclass to sync (e.g. CartItemOrder or ItemOrder)
+    :param parent_field: Name of the model's ForeignKey to the parent (e.g. "cart" or "order")
+    :param parent: Parent instance that owns the item orders
+    :param posted_items: List of {"item": {"item_id": ...}, "count": ...} dictionaries from the frontend
+    :return: Dictionary of changed item_ids mapped to their (old count, new count)
+    :raises MenuItem.DoesNotExist: If a posted item does not exist on the menu. Nothing is changed in this case
+    """
+    wanted_counts = posted_counts(posted_items)
+
+    # No savepoint when nested in a caller's transaction. A failure here rolls the caller back as well
+    with transaction.atomic(savepoint=False):
+        current_rows = {row.item_id: row for row in model.objects.filter(**{parent_field: parent})}
+        changes = diff_counts({item_id: row.count for item_id, row in current_rows.items()}, wanted_counts)
+
+        new_item_ids = [item_id for item_id in changes if item_id not in current_rows]
+        if new_item_ids:
+            found_item_ids = set(MenuItem.objects.filter(item_id__in=new_item_ids).values_list("item_id", flat=True))
+            missing_item_ids = sorted(set(new_item_ids) - found_item_ids)
+            if missing_item_ids:
+                raise MenuItem.DoesNotExist(f"Menu Items Not Found {missing_item_ids}")
+
+        to_upsert = [
+            model(**{parent_field: parent}, item_id=item_id, count=new_count)
+            for item_id, (old_count, new_count) in changes.items() if new_count > 0
+        ]
+        to_delete = [
+            current_rows[item_id].pk for item_id, (old_count, new_count) in changes.items() if new_count == 0
+        ]
+
+        if to_upsert:
+            model.objects.bulk_create(
+                to_upsert, update_conflicts=True, unique_fields=[parent_field, "item"], update_fields=["count"]
+            )
+        if to_delete:
+            model.objects.filter(pk__in=to_delete).delete()
+
+    return changes
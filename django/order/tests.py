@@ -0,0 +1,247 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase
+from django.utils import timezone
+
+from menu.models import MenuItem
+from .archive import archive_orders
+from .events import FEED_RESET, ORDER_CREATED, DatabaseBroker
+from .export import export_orders
+from .models import ArchivedOrder, ItemOrder, ItemSales, Order, OrderVolume
+from .stats import rebuild_rollups, record_sales
+
+
+class ListOrderTests(TestCase):
+    def setUp(self):
+        self.items = [MenuItem.objects.create(name=f"Item {index}", description="") for index in range(3)]
+
+    def create_orders(self, count, fulfilled=False):
+        Order.objects.bulk_create([Order(fulfilled=fulfilled) for _ in range(count)])
+        orders = list(Order.objects.order_by("-order_number")[:count])
+        ItemOrder.objects.bulk_create([
+            ItemOrder(order=order, item=item, count=index + 1)
+            for order in orders
+            for index, item in enumerate(self.items)
+        ])
+        return sorted(order.order_number for order in orders)
+
+    def list_orders(self, query=""):
+        response = self.client.get(f"/order/list{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_lists_orders_with_items(self):
+        order_numbers = self.create_orders(3)
+        with self.assertNumQueries(2):
+            body = self.list_orders()
+        self.assertEqual([order["order_number"] for order in body["orders"]], order_numbers)
+        self.assertIsNone(body["next_cursor"])
+        self.assertEqual(body["orders"][0]["items"], [
+            {"item": {"item_id": item.item_id, "name": item.name, "description": ""}, "count": index + 1}
+            for index, item in enumerate(self.items)
+        ])
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.create_orders(2)
+        with self.assertNumQueries(2):
+            self.list_orders()
+        self.create_orders(40)
+        with self.assertNumQueries(2):
+            body = self.list_orders()
+        self.assertEqual(len(body["orders"]), 42)
+
+    def test_fulfilled_filter(self):
+        open_orders = self.create_orders(3)
+        fulfilled_orders = self.create_orders(2, fulfilled=True)
+        with self.assertNumQueries(2):
+            body = self.list_orders("?fulfilled=false")
+        self.assertEqual([order["order_number"] for order in body["orders"]], open_orders)
+        body = self.list_orders("?fulfilled=true")
+        self.assertEqual([order["order_number"] for order in body["orders"]], fulfilled_orders)
+        self.assertEqual(self.client.get("/order/list?fulfilled=maybe").status_code, 400)
+
+    def test_after_and_limit_paging(self):
+        order_numbers = self.create_orders(5)
+        with self.assertNumQueries(2):
+            first_page = self.list_orders("?limit=2")
+        self.assertEqual([order["order_number"] for order in first_page["orders"]], order_numbers[:2])
+        self.assertEqual(first_page["next_cursor"], order_numbers[1])
+
+        second_page = self.list_orders(f"?limit=2&after={first_page['next_cursor']}")
+        self.assertEqual([order["order_number"] for order in second_page["orders"]], order_numbers[2:4])
+        self.assertEqual(second_page["next_cursor"], order_numbers[3])
+
+        last_page = self.list_orders(f"?limit=2&after={second_page['next_cursor']}")
+        self.assertEqual([order["order_number"] for order in last_page["orders"]], order_numbers[4:])
+        self.assertIsNone(last_page["next_cursor"])
+
+    def test_invalid_paging(self):
+        self.assertEqual(self.client.get("/order/list?limit=0").status_code, 400)
+        self.assertEqual(self.client.get("/order/list?after=x").status_code, 400)
+
+
+class ArchiveOrdersTests(TestCase):
+    def setUp(self):
+        self.item = MenuItem.objects.create(name="Cake", description="A cake")
+
+    def fulfilled_order(self, order_number):
+        order = Order.objects.create(
+            order_number=order_number, fulfilled=True, fulfilled_at=timezone.now() - timedelta(days=2)
+        )
+        ItemOrder.objects.create(order=order, item=self.item, count=2)
+        return order
+
+    def test_archives_fulfilled_orders(self):
+        self.fulfilled_order(1)
+        Order.objects.create(order_number=2, fulfilled=False)
+
+        self.assertEqual(archive_orders(timedelta(hours=24)), 1)
+        self.assertEqual(list(Order.objects.values_list("order_number", flat=True)), [2])
+        self.assertEqual(ArchivedOrder.objects.get().items, [{"item_id": self.item.item_id, "name": "Cake", "count": 2}])
+
+    def test_archiving_a_reused_order_number_leaves_the_live_order(self):
+        self.fulfilled_order(1)
+        archive_orders(timedelta(hours=24))
+        # Reused order number, e.g. after the order sequence was reset
+        self.fulfilled_order(1)
+        self.fulfilled_order(2)
+
+        with self.assertLogs("order.archive", "ERROR") as logs:
+            self.assertEqual(archive_orders(timedelta(hours=24)), 1)
+        self.assertIn("[1]", logs.output[0])
+        self.assertEqual(list(Order.objects.values_list("order_number", flat=True)), [1])
+        self.assertEqual(ItemOrder.objects.get().order_id, 1)
+        self.assertEqual(list(ArchivedOrder.objects.values_list("order_number", flat=True)), [1, 2])
+
+    def test_reused_order_numbers_do_not_stall_archiving(self):
+        self.fulfilled_order(1)
+        archive_orders(timedelta(hours=24))
+        self.fulfilled_order(1)
+        for order_number in range(2, 5):
+            self.fulfilled_order(order_number)
+
+        with self.assertLogs("order.archive", "ERROR"):
+            self.assertEqual(archive_orders(timedelta(hours=24), batch_size=1), 3)
+
+    def test_export_and_stats_count_both_orders_with_a_reused_number(self):
+        self.fulfilled_order(1)
+        archive_orders(timedelta(hours=24))
+        self.fulfilled_order(1)
+
+        exported = [json.loads(line) for line in b"".join(export_orders(include_archived=True)).splitlines()]
+        self.assertEqual([order["archived"] for order in exported], [True, False])
+        rebuild_rollups()
+        self.assertEqual(sum(OrderVolume.objects.filter(period="day").values_list("orders", flat=True)), 2)
+
+
+class DatabaseBrokerTests(TestCase):
+    async def next_events(self, stream, count):
+        return [await asyncio.wait_for(stream.__anext__(), timeout=5) for _ in range(count)]
+
+    async def test_listeners_receive_events_published_by_another_worker(self):
+        listening_worker = DatabaseBroker(poll_seconds=0.01)
+        publishing_worker = DatabaseBroker(poll_seconds=0.01)
+        stream = listening_worker.listen()
+        listening = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+
+        published = await sync_to_async(publishing_worker.publish)(ORDER_CREATED, {"order_number": 1})
+        event = await asyncio.wait_for(listening, timeout=5)
+        self.assertEqual((event.event_id, event.data), (published.event_id, {"order_number": 1}))
+        await stream.aclose()
+
+    async def test_resumes_from_event_ids_of_another_worker(self):
+        publishing_worker = DatabaseBroker(poll_seconds=0.01)
+        first = await sync_to_async(publishing_worker.publish)(ORDER_CREATED, {"order_number": 1})
+        await sync_to_async(publishing_worker.publish_many)(ORDER_CREATED, [{"order_number": 2}, {"order_number": 3}])
+
+        stream = DatabaseBroker(poll_seconds=0.01).listen(last_event_id=first.event_id)
+        events = await self.next_events(stream, 2)
+        self.assertEqual([event.data["order_number"] for event in events], [2, 3])
+        await stream.aclose()
+
+    async def test_unknown_event_id_resets_the_feed(self):
+        await sync_to_async(DatabaseBroker().publish)(ORDER_CREATED, {"order_number": 1})
+        stream = DatabaseBroker(poll_seconds=0.01).listen(last_event_id=10 ** 9)
+        [event] = await self.next_events(stream, 1)
+        self.assertEqual(event.event_type, FEED_RESET)
+        await stream.aclose()
+
+
+class DeleteOrderRollupTests(TestCase):
+    def setUp(self):
+        self.item = MenuItem.objects.create(name="Cake", description="A cake")
+
+    def place_order(self, fulfilled):
+        order = Order.objects.create(fulfilled=fulfilled, fulfilled_at=timezone.now() if fulfilled else None)
+        ItemOrder.objects.create(order=order, item=self.item, count=3)
+        record_sales([(order.placed_at, self.item.item_id, 3)], [order.placed_at])
+        return order
+
+    def rollups(self):
+        return (
+            sorted(OrderVolume.objects.filter(period="day").values_list("bucket", "orders")),
+            sorted(ItemSales.objects.filter(period="day").exclude(count=0).values_list("bucket", "item_id", "count")),
+        )
+
+    def test_deleting_served_orders_keeps_their_sales(self):
+        served = self.place_order(fulfilled=True)
+        self.client.post(f"/order/delete/{served.order_number}")
+
+        [(_, orders)], [(_, _, count)] = self.rollups()
+        self.assertEqual((orders, count), (1, 3))
+        self.assertTrue(ArchivedOrder.objects.filter(order_number=served.order_number).exists())
+
+    def test_deleting_unfulfilled_orders_removes_them(self):
+        self.place_order(fulfilled=True)
+        cancelled = self.place_order(fulfilled=False)
+        self.client.post(f"/order/delete/{cancelled.order_number}")
+
+        [(_, orders)], [(_, _, count)] = self.rollups()
+        self.assertEqual((orders, count), (1, 3))
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+    def test_deleted_served_orders_move_to_history(self):
+        served = self.place_order(fulfilled=True)
+        self.client.post(f"/order/delete/{served.order_number}")
+
+        [order] = self.client.get("/order/history").json()["orders"]
+        self.assertEqual(order["order_number"], served.order_number)
+        self.assertFalse(Order.objects.exists())
+
+    def test_deleting_served_orders_with_an_archived_number_logs_it(self):
+        served = self.place_order(fulfilled=True)
+        ArchivedOrder.objects.create(order_number=served.order_number, placed_at=served.placed_at, items=[])
+        record_sales(orders=[served.placed_at])
+        with self.assertLogs("order.stats", "ERROR"):
+            self.client.post(f"/order/delete/{served.order_number}")
+
+        self.assertEqual(ArchivedOrder.objects.get().items, [])
+        kept = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), kept)
+
+    def test_rebuild_matches_rollups_after_batch_delete(self):
+        orders = [self.place_order(fulfilled=index % 2 == 0) for index in range(4)]
+        self.client.post("/order/batch", {"actions": [
+            {"order_number": order.order_number, "action": "delete"} for order in orders[1:]
+        ]}, content_type="application/json")
+
+        kept = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), kept)
+        self.assertEqual(kept[0][0][1], 2)
+
+
+class BatchOrderTests(TestCase):
+    def test_invalid_json_is_rejected(self):
+        response = self.client.post("/order/batch", b"{actions", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_bodies_that_are_not_objects_are_rejected(self):
+        for body in ([{"order_number": 1, "action": "delete"}], "actions", 1):
+            response = self.client.post("/order/batch", body, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
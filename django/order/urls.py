@@ -6,4 +6,8 @@ urlpatterns = [
     path('fulfill/change/<int:order_number>', views.change_fulfill),
     path('delete/<int:order_number>', views.delete_order),
     path('sync', views.sync_order),
+    path('batch', views.batch_orders),
+    path('history', views.order_history),
+    path('stats', views.order_stats),
+    path('export', views.export_order_stream),
 ]
@@ -1,44 +1,220 @@
 import json
+import logging
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse, JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework.decorators import api_view
 
+from OrderUp.idempotency import idempotent
+from OrderUp.instrumentation import timed
+from OrderUp.rendering import json_response
 from menu.models import MenuItem
-from .models import Order, ItemOrder
-from .serializers import OrderSerializer
+from .batch import BatchError, apply_batch, parse_batch
+from .export import EXPORT_CONTENT_TYPES, ExportError, export_filename, export_orders, parse_export_params
+from .events import ORDER_DELETED, ORDER_FULFILLED, ORDER_SYNCED, publish_order_event
+from .models import ArchivedOrder, Order, ItemOrder
+from .params import parse_bool_param, parse_datetime_param
+from .serializers import ArchivedOrderSerializer, order_dicts
+from .stats import STATS_PERIODS, bucket_start, bucket_step, read_stats, record_deleted_orders, record_sales
+from .sync import sync_item_orders
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the page size a client can request from list_order
+ORDER_LIST_MAX_LIMIT = 500
+ORDER_HISTORY_DEFAULT_LIMIT = 50
+# Buckets order/stats returns by default, and at most
+STATS_DEFAULT_BUCKETS = {"hour": 24, "day": 30}
+STATS_MAX_BUCKETS = 24 * 31
 
 
 @api_view(["GET"])
 def list_order(request):
-    all_orders = Order.objects.all()
+    """
+    Lists orders using a fixed number of queries (one for orders, one for their items)
+    Optional query parameters:
+        fulfilled - Only list orders with a matching fulfillment status (e.g. fulfilled=false for the open queue)
+        after - Cursor. Only list orders with an order_number greater than this one
+        limit - Maximum number of orders to return. Returns every matching order if omitted
+    """
+    orders = Order.objects.order_by("order_number")
+
+    fulfilled_param = request.GET.get("fulfilled")
+    if fulfilled_param is not None:
+        fulfilled = parse_bool_param(fulfilled_param)
+        if fulfilled is None:
+            return HttpResponse(f"Invalid fulfilled Filter [{fulfilled_param}]", status=400)
+        orders = orders.filter(fulfilled=fulfilled)
+
+    try:
+        after = int(request.GET.get("after", 0))
+        limit = int(request.GET["limit"]) if "limit" in request.GET else None
+    except ValueError:
+        return HttpResponse("Invalid Pagination Parameters", status=400)
+    if limit is not None and not 0 < limit <= ORDER_LIST_MAX_LIMIT:
+        return HttpResponse(f"Limit Must Be Between 1 and {ORDER_LIST_MAX_LIMIT}", status=400)
+
+    # Keyset pagination on order_number stays fast no matter how deep the cursor is
+    if after:
+        orders = orders.filter(order_number__gt=after)
+    if limit is not None:
+        # Fetch one extra order to know whether another page exists without a separate COUNT query
+        orders = orders[:limit + 1]
+
+    with timed("serialize"):
+        serialized_orders = order_dicts(orders)
+    next_cursor = None
+    if limit is not None and len(serialized_orders) > limit:
+        serialized_orders = serialized_orders[:limit]
+        next_cursor = serialized_orders[-1]["order_number"]
+    return json_response({
+        "orders": serialized_orders,
+        "next_cursor": next_cursor
+    })
+
+
+@api_view(["GET"])
+def order_history(request):
+    """
+    Lists archived orders newest first, one page per query
+    Optional query parameters:
+        before - Cursor. Only list orders with an order_number less than this one
+        limit - Maximum number of orders to return (Default 50)
+    """
+    try:
+        before = int(request.GET["before"]) if "before" in request.GET else None
+        limit = int(request.GET.get("limit", ORDER_HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return HttpResponse("Invalid Pagination Parameters", status=400)
+    if not 0 < limit <= ORDER_LIST_MAX_LIMIT:
+        return HttpResponse(f"Limit Must Be Between 1 and {ORDER_LIST_MAX_LIMIT}", status=400)
+
+    orders = ArchivedOrder.objects.order_by("-order_number")
+    if before is not None:
+        orders = orders.filter(order_number__lt=before)
+    orders = list(orders[:limit + 1])
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = orders[-1].order_number
+
+    with timed("serialize"):
+        serialized_orders = ArchivedOrderSerializer(orders, many=True).data
+    return JsonResponse({
+        "orders": serialized_orders,
+        "next_cursor": next_cursor
+    })
+
+
+@api_view(["GET"])
+def order_stats(request):
+    """
+    Orders and units sold per item by hour or day, read only from the rollups kept by order/stats.py
+    Optional query parameters:
+        period - "hour" (Default) or "day"
+        since - ISO datetime. First bucket to include (Default: 24 hours or 30 days before until)
+        until - ISO datetime. Buckets starting at or after this are excluded (Default: End of the current bucket)
+    """
+    period = request.GET.get("period", "hour")
+    if period not in STATS_PERIODS:
+        return HttpResponse(f"Period Must Be One Of {list(STATS_PERIODS)}", status=400)
+    step = bucket_step(period)
+    try:
+        until = parse_datetime_param(request.GET.get("until"))
+        since = parse_datetime_param(request.GET.get("since"))
+    except ValueError:
+        return HttpResponse("since and until Must Be ISO Datetimes", status=400)
+
+    until = until or bucket_start(timezone.now(), period) + step
+    since = since or until - step * STATS_DEFAULT_BUCKETS[period]
+    if not since < until <= since + step * STATS_MAX_BUCKETS:
+        return HttpResponse(f"Range Must Cover Between 1 and {STATS_MAX_BUCKETS} Buckets", status=400)
+
     return JsonResponse({
-        "orders": OrderSerializer(all_orders, many=True).data
+        "period": period,
+        "since": since,
+        "until": until,
+        "buckets": read_stats(period, since, until)
     })
 
 
+@api_view(["GET"])
+def export_order_stream(request):
+    """
+    Streams every matching order with its items as NDJSON or CSV for reconciliation, with flat memory use
+    Served by order.export.order_export instead under ASGI (see OrderUp/asgi.py)
+    Optional query parameters:
+        output - "ndjson" (Default, one order per line) or "csv" (one line item per row)
+        fulfilled - Only export orders with a matching fulfillment status
+        since, until - ISO datetimes. Only export orders placed in [since, until)
+        archived - Also export archived orders (Default false)
+    """
+    try:
+        params = parse_export_params(request.GET)
+    except ExportError as err:
+        return HttpResponse(str(err), status=400)
+    response = StreamingHttpResponse(export_orders(**params), content_type=EXPORT_CONTENT_TYPES[params["export_format"]])
+    response["Content-Disposition"] = f'attachment; filename="{export_filename(params["export_format"])}"'
+    return response
+
+
 @api_view(["POST"])
 def change_fulfill(request, order_number):
     new_order_obj = json.loads(request.body)
     new_order_fulfill = new_order_obj["fulfilled"]
     order_obj = Order.objects.get(order_number=order_number)
     order_obj.fulfilled = new_order_fulfill
+    order_obj.fulfilled_at = timezone.now() if new_order_fulfill else None
     order_obj.save()
+    publish_order_event(ORDER_FULFILLED, {"order_number": order_obj.order_number, "fulfilled": order_obj.fulfilled})
     return HttpResponse(
         f"Successfully Changed Fulfillment Status For Order {order_obj.order_number} to {new_order_fulfill}")
 
 
 @api_view(["POST"])  # TODO: Change to DELETE after checking CORS
 def delete_order(request, order_number):
-    print(f"Deleting Order [{order_number}]")
-    Order.objects.get(order_number=order_number).delete()
+    """
+    Deletes an order. Fulfilled orders were sold, so they are moved to /order/history and stay in order/stats
+    (see order.stats.record_deleted_orders)
+    """
+    logger.info("Deleting Order [%s]", order_number)
+    with transaction.atomic():
+        record_deleted_orders([order_number])
+        Order.objects.get(order_number=order_number).delete()
+    publish_order_event(ORDER_DELETED, {"order_number": order_number})
     return HttpResponse(f"Order #{order_number} Deleted")
 
 
 @api_view(["POST"])
+def batch_orders(request):
+    """
+    Fulfills, unfulfills or deletes many orders at once with a fixed number of queries (see order/batch.py)
+    Body: {"actions": [{"order_number": ..., "action": "fulfill" | "unfulfill" | "delete"}]}
+    Responds with a result per action: "ok", "not_found" or "duplicate" (Order already had an earlier action)
+    """
+    try:
+        batch_obj = json.loads(request.body)
+    except ValueError:
+        return HttpResponse("Batch Must Be A JSON Object", status=400)
+    if not isinstance(batch_obj, dict):
+        return HttpResponse("Batch Must Be A JSON Object", status=400)
+    try:
+        actions = parse_batch(batch_obj.get("actions"))
+    except BatchError as err:
+        return HttpResponse(str(err), status=400)
+
+    results = apply_batch(actions)
+    logger.info("Order Batch Applied [%s Action(s)]", len(actions))
+    return JsonResponse({"results": results})
+
+
+@api_view(["POST"])
+@idempotent
 def sync_order(request):
     """Syncs the Order and all the order related items. Assumes Order exists"""
-    # Note: Similar to cart/views.py
+    # Note: Shares the diff engine in order/sync.py with cart/views.py
     order_obj = json.loads(request.body)
     order_number = order_obj["order_number"]
     order_items = order_obj["items"]
@@ -48,30 +224,24 @@ def sync_order(request):
     except ObjectDoesNotExist:
         return HttpResponse(f"Order [{order_number}] Not Found", status=404)
 
-    item_orders = ItemOrder.objects.filter(order=order)
-    print("Items located for sync")
-    for order_item in order_items:
-        order_item_item = order_item["item"]
-        item_id = order_item_item["item_id"]
-        try:
-            item_order = item_orders.all().get(item__item_id=int(item_id))
-        except ObjectDoesNotExist:
-            menuitem = MenuItem.objects.get(item_id=int(item_id))
-            item_order = ItemOrder(order=order, item=menuitem, count=0)
-            print(f"New Order Item Order Created For [{menuitem.name}]")
-
-        if item_order.count != order_item["count"]:
-            print(f"Count Mismatch of {item_order.count} needing to sync to {order_item['count']}")
-            item_order.count = order_item["count"]
-            item_order.save()
-            # print(f"Order Item Order Edited For [{item_order.item.name}]")
-            print(
-                "Order Contents Changed "
-                f"[Order {order_number} <-- Item #{item_id} - [{item_order.item.name}] x{item_order.count}]"
-            )
-
-    # Remove items that are not in the order anymore or have a count of 0
-    item_orders.all().filter(count__lte=0).delete()
-    item_orders.all().exclude(item__item_id__in=[order_item["item"]["item_id"] for order_item in order_items]).delete()
+    try:
+        with transaction.atomic():
+            changes = sync_item_orders(ItemOrder, "order", order, order_items)
+            record_sales([
+                (order.placed_at, item_id, new_count - old_count)
+                for item_id, (old_count, new_count) in changes.items()
+            ])
+    except MenuItem.DoesNotExist as err:
+        return HttpResponse(str(err), status=404)
+
+    if changes:
+        logger.info("Order Contents Changed [Order %s] %s", order_number, changes, extra={"changes": changes})
+        publish_order_event(ORDER_SYNCED, {
+            "order_number": order.order_number,
+            "changes": [
+                {"item_id": item_id, "old_count": old_count, "new_count": new_count}
+                for item_id, (old_count, new_count) in changes.items()
+            ]
+        })
 
     return HttpResponse("Order Synced")